@@ -1,62 +1,239 @@
+import bisect
+import bz2
+import collections
+import concurrent.futures
+import contextlib
+import heapq
+import io
 import json
 import lzma
+import math
+import mmap
 import multiprocessing
 import os
 import pickle
 import re
+import shutil
+import struct
 import time
+import tracemalloc
 import zipfile
 import zlib
 from typing import Any
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
 import file_util
 from file_util import create_file
 from interact_util import progress_bar
 
 
-def check_int_or_float(input_str: str) -> type:
-    int_pattern = r'^[-+]?\d+$'
-    float_pattern = r'^[-+]?\d+(\.\d+)?$'
+_int_pattern = re.compile(r'^[-+]?\d+$')
+_float_pattern = re.compile(r'^[-+]?\d+(\.\d+)?$')
+_number_key_pattern = re.compile(r'[-+]?\d+(\.\d+)?')
+
 
-    if re.match(int_pattern, input_str):
+def check_int_or_float(input_str: str) -> type:
+    if _int_pattern.match(input_str):
         return int
-    elif re.match(float_pattern, input_str):
+    elif _float_pattern.match(input_str):
         return float
     else:
         return str
 
 
+def _convert_key_to_number(key: Any) -> Any:
+    if type(key) is not str:
+        return key
+    # fast path for the most common keys, like page numbers
+    if key.isdecimal():
+        return int(key)
+    match = _number_key_pattern.fullmatch(key)
+    if match is None:
+        return key
+    return float(key) if match.group(1) else int(key)
+
+
+def number_key_object_pairs_hook(pairs: list) -> dict:
+    """object_pairs_hook for json.load(s), converts the number keys when parsing,
+    for example, json.loads('{"1": {"2.5": 0}}', object_pairs_hook=number_key_object_pairs_hook)"""
+    return {_convert_key_to_number(key): value for key, value in pairs}
+
+
+_containers = (dict, list, tuple, set)
+
+
 def convert_json_dict_key_to_number(data: object) -> object:
-    if isinstance(data, dict):
-        # if data type is dict, convert it
-        converted_dict = {}
-        for key, value in data.items():
-            if type(key) == str:
-                trans_type = check_int_or_float(key)
-                key = trans_type(key)
-            # process the values in dict, using recursion
-            value = convert_json_dict_key_to_number(value)
-            converted_dict[key] = value
-        return converted_dict
-    elif isinstance(data, (list, tuple, set)):
-        # if date type is list, tuple or set, process it recursively
-        converted_list = []
-        for item in data:
-            converted_item = convert_json_dict_key_to_number(item)
-            converted_list.append(converted_item)
-        return type(data)(converted_list)
-    else:
-        # if it's other type, don't process
+    """
+    convert the str keys of dicts which are int or float to number, in all nested containers.
+    it's non-recursive, and the containers without any converted key inside are returned as they are
+    """
+    if not isinstance(data, _containers):
         return data
 
+    def _new_frame(container):
+        if isinstance(container, dict):
+            keys = [_convert_key_to_number(key) for key in container]
+            changed = any(new_key is not old_key for new_key, old_key in zip(keys, container))
+            return [container, keys, list(container.values()), 0, [], changed]
+        return [container, None, list(container), 0, [], False]
+
+    # frame: [container, converted keys, items, index of next item, converted items, changed]
+    stack = [_new_frame(data)]
+    while True:
+        frame = stack[-1]
+        container, keys, items, index, converted_items, changed = frame
+        # take the plain items in a loop, until a container needs to be descended into
+        child = None
+        while index < len(items):
+            item = items[index]
+            index += 1
+            if isinstance(item, _containers):
+                child = item
+                break
+            converted_items.append(item)
+        frame[3] = index
+        if child is not None:
+            stack.append(_new_frame(child))
+            continue
+        stack.pop()
+        if changed:
+            if keys is not None:
+                converted = dict(zip(keys, converted_items))
+            else:
+                converted = type(container)(converted_items)
+        else:
+            converted = container
+        if not stack:
+            return converted
+        parent = stack[-1]
+        parent[4].append(converted)
+        if converted is not container:
+            parent[5] = True
+
+
+class _UnsupportedJsonOption(Exception):
+    pass
+
+
+def _has_non_finite_float(pyjson: object) -> bool:
+    stack = [pyjson]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, float):
+            if not math.isfinite(item):
+                return True
+        elif isinstance(item, dict):
+            stack.extend(item)
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return False
+
+
+def _orjson_dumps(pyjson: object, indent: int | None, ensure_ascii: bool) -> bytes:
+    # orjson always outputs utf-8 and only supports indent of 2
+    if ensure_ascii or indent not in (None, 2):
+        raise _UnsupportedJsonOption
+    option = orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    data = orjson.dumps(pyjson, option=option)
+    # orjson outputs NaN and Infinity as null, but the stdlib json keeps them, only search them if there is null
+    if b'null' in data and _has_non_finite_float(pyjson):
+        raise _UnsupportedJsonOption
+    return data
+
+
+def _ujson_dumps(pyjson: object, indent: int | None, ensure_ascii: bool) -> bytes:
+    return ujson.dumps(pyjson, indent=indent or 0, ensure_ascii=ensure_ascii,
+                       escape_forward_slashes=False).encode('utf-8')
+
+
+def _json_dumps(pyjson: object, indent: int | None, ensure_ascii: bool) -> bytes:
+    return json.dumps(pyjson, indent=indent, ensure_ascii=ensure_ascii).encode('utf-8')
+
+
+"""
+json_backends = {backend_name->str: (loads(bytes | str), dumps(pyjson, indent, ensure_ascii) -> bytes), ...}
+the backends are tried from json_backend in the order of json_backends, if a backend fails on the data
+or doesn't support the options, the next one is used, and the stdlib json is always the last one
+"""
+json_backends = {}
+if orjson:
+    json_backends['orjson'] = (orjson.loads, _orjson_dumps)
+if ujson:
+    json_backends['ujson'] = (ujson.loads, _ujson_dumps)
+json_backends['json'] = (json.loads, _json_dumps)
+json_backend = next(iter(json_backends))
+
+
+def set_json_backend(name: str) -> str:
+    global json_backend
+    if name not in json_backends:
+        raise ValueError(f'{name} no support, available backends: {list(json_backends)}')
+    json_backend = name
+    return name
+
+
+def _iter_json_backends():
+    backend_names = list(json_backends)
+    for name in backend_names[backend_names.index(json_backend):]:
+        yield name, json_backends[name]
+
+
+def json_loads(data: bytes | str) -> Any:
+    for name, (loads, _) in _iter_json_backends():
+        try:
+            return loads(data)
+        except ValueError:
+            # let the stdlib json raise the error for the real invalid data
+            if name == 'json':
+                raise
+
+
+def json_dumps(pyjson: object, indent: int = None, ensure_ascii: bool = True) -> bytes:
+    for name, (_, dumps) in _iter_json_backends():
+        try:
+            return dumps(pyjson, indent, ensure_ascii)
+        except (_UnsupportedJsonOption, TypeError, ValueError, OverflowError):
+            if name == 'json':
+                raise
+
+
+def _is_utf8(encoding: str) -> bool:
+    return encoding.lower().replace('_', '-') in ('utf-8', 'utf8')
+
 
 def load_json(file_path: str, encoding: str = 'utf-8', trans_key_to_num: bool = False) -> Any:
-    with open(file_path, encoding=encoding) as file_path:
-        pyjson = json.load(file_path)
     if trans_key_to_num:
-        return convert_json_dict_key_to_number(pyjson)
-    else:
-        return pyjson
+        # the stdlib json converts the keys when parsing, it's faster than the fast backends with a second pass
+        with open(file_path, encoding=encoding) as f:
+            return json.load(f, object_pairs_hook=number_key_object_pairs_hook)
+    if _is_utf8(encoding):
+        with open(file_path, 'rb') as f:
+            return json_loads(f.read())
+    with open(file_path, encoding=encoding) as f:
+        return json.load(f)
 
 
 def _get_empty_data_structure(data_type: type):
@@ -80,15 +257,127 @@ def load_json_maybe_null(file_path: str, data_type, allow_null: bool = False, en
         return _get_empty_data_structure(data_type)
 
 
+def _dump_json(pyjson: object, file_path: str, encoding: str, indent: int | None, ensure_ascii: bool) -> None:
+    if _is_utf8(encoding):
+        with open(file_path, 'wb') as f:
+            f.write(json_dumps(pyjson, indent, ensure_ascii))
+    else:
+        with open(file_path, 'w', encoding=encoding) as f:
+            json.dump(pyjson, f, indent=indent, ensure_ascii=ensure_ascii)
+
+
 def dump_json(pyjson: object, file_path: str, encoding: str = 'utf-8') -> None:
-    with open(file_path, 'w', encoding=encoding) as file_path:
-        json.dump(pyjson, file_path)
+    _dump_json(pyjson, file_path, encoding, None, True)
 
 
 def dump_json_human_friendly(pyjson: object, file_path, encoding='utf-8', indent: int = 4,
                              ensure_ascii: bool = False) -> None:
-    with open(file_path, 'w', encoding=encoding) as file_path:
-        json.dump(pyjson, file_path, indent=indent, ensure_ascii=ensure_ascii)
+    _dump_json(pyjson, file_path, encoding, indent, ensure_ascii)
+
+
+def merge_json_records(records) -> Any:
+    """merge records one by one, the lists are extended, the dicts are merged recursively,
+    and the other values are replaced by the later ones. the first record is updated in place"""
+    def _merge(old: Any, new: Any) -> Any:
+        if isinstance(old, list) and isinstance(new, list):
+            old.extend(new)
+            return old
+        if isinstance(old, dict) and isinstance(new, dict):
+            for key, value in new.items():
+                old[key] = _merge(old[key], value) if key in old else value
+            return old
+        return new
+
+    merged = None
+    for record in records:
+        merged = record if merged is None else _merge(merged, record)
+    return merged
+
+
+class JsonLinesStore:
+    """
+    append-only json lines file, every record is a line, so appending is O(1),
+    instead of loading and dumping the whole json file every time.
+    load() merges all records by merge_json_records(), and compact() rewrites the file to one merged record,
+    if compact_every is set, it's done automatically after that number of appends by this store.
+    for example, appending {'func': [1]} and {'func': [2]} then load() -> {'func': [1, 2]}
+    the appends take a shared lock and compact() and clear() take an exclusive lock on '<file_path>.lock',
+    so the records appended by the other processes while compacting won't be lost.
+    the lock needs fcntl.flock, without it (on windows), only one process should write the store.
+    """
+    def __init__(self, file_path: str, compact_every: int = None):
+        self.file_path = file_path
+        self.compact_every = compact_every
+        self.appended_count = 0
+
+    @contextlib.contextmanager
+    def _lock(self, exclusive: bool):
+        if fcntl is None:
+            yield
+            return
+        with open(create_file(f'{self.file_path}.lock'), 'rb') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _ensure_newline_at_end(self, f) -> None:
+        """a crash may leave a torn line without newline at the end, don't let the next record join it"""
+        with open(self.file_path, 'rb') as rf:
+            if rf.seek(0, os.SEEK_END) == 0:
+                return
+            rf.seek(-1, os.SEEK_END)
+            if rf.read(1) != b'\n':
+                f.write(b'\n')
+
+    def extend(self, records) -> None:
+        lines = b''.join(json_dumps(record, ensure_ascii=False) + b'\n' for record in records)
+        create_file(self.file_path)
+        with self._lock(exclusive=False), open(self.file_path, 'ab') as f:
+            self._ensure_newline_at_end(f)
+            # one write for all lines, so the concurrent appenders won't interleave in a line
+            f.write(lines)
+        self.appended_count += lines.count(b'\n')
+        if self.compact_every and self.appended_count >= self.compact_every:
+            self.compact()
+
+    def append(self, record: Any) -> None:
+        self.extend([record])
+
+    def __iter__(self):
+        """stream the records, the torn lines left by crashes are skipped"""
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json_loads(line)
+                except ValueError:
+                    # JSONDecodeError, or UnicodeDecodeError if a multibyte character is torn
+                    continue
+                yield record
+
+    def load(self, trans_key_to_num: bool = False) -> Any:
+        merged = merge_json_records(self)
+        return convert_json_dict_key_to_number(merged) if trans_key_to_num else merged
+
+    def clear(self) -> None:
+        with self._lock(exclusive=True):
+            open(create_file(self.file_path), 'w').close()
+        self.appended_count = 0
+
+    def compact(self) -> None:
+        with self._lock(exclusive=True):
+            merged = self.load()
+            temp_path = f'{self.file_path}.compacting'
+            with open(temp_path, 'wb') as f:
+                if merged is not None:
+                    f.write(json_dumps(merged, ensure_ascii=False) + b'\n')
+            os.replace(temp_path, self.file_path)
+        self.appended_count = 0
 
 
 def save_obj_with_pickle(obj: object, file_path: str) -> None:
@@ -102,49 +391,497 @@ def load_obj_with_pickle(file_path: str) -> object:
     return obj
 
 
-compress_error_info = 'Used_lib just can be choose in "lzma" and "zlib"'
+class _MmapPickler(pickle.Pickler):
+    """pickle protocol 5, puts the out-of-band buffers and the big bytes into the aligned buffer file"""
+    def __init__(self, file, buffer_file, alignment: int, min_bytes_size: int | None):
+        super().__init__(file, protocol=5, buffer_callback=self._buffer_callback)
+        self.buffer_file = buffer_file
+        self.alignment = alignment
+        self.min_bytes_size = min_bytes_size
+        # [(offset, length), ...]
+        self.buffer_table = []
+        # the indexes of buffer_table, in the order of pickle's out-of-band buffers
+        self.out_of_band = []
+
+    def _write_buffer(self, data) -> int:
+        data = memoryview(data).cast('B')
+        self.buffer_file.write(b'\x00' * (-self.buffer_file.tell() % self.alignment))
+        self.buffer_table.append((self.buffer_file.tell(), data.nbytes))
+        self.buffer_file.write(data)
+        return len(self.buffer_table) - 1
+
+    def _buffer_callback(self, buffer: pickle.PickleBuffer) -> bool:
+        try:
+            data = buffer.raw()
+        except BufferError:
+            return True
+        self.out_of_band.append(self._write_buffer(data))
+        return False
+
+    def persistent_id(self, obj: object) -> int | None:
+        # bytes is always pickled in-band, so take it out by persistent id
+        if self.min_bytes_size is not None and type(obj) in (bytes, bytearray) and len(obj) >= self.min_bytes_size:
+            return self._write_buffer(obj)
+        return None
+
+
+class _MmapUnpickler(pickle.Unpickler):
+    def __init__(self, file, views: list, out_of_band: list):
+        super().__init__(file, buffers=(views[i] for i in out_of_band))
+        self.views = views
 
+    def persistent_load(self, pid: int) -> memoryview:
+        return self.views[pid]
 
-def compress_obj(obj: object, used_lib: str = 'lzma') -> bytes:
+
+def _get_buffer_file_path(file_path: str) -> str:
+    return f'{file_path}.buffers'
+
+
+def save_obj_with_pickle_mmap(obj: object, file_path: str, alignment: int = 64,
+                              min_bytes_size: int = None) -> str:
+    """
+    like save_obj_with_pickle, but the out-of-band buffers of pickle protocol 5 (numpy arrays, PickleBuffer)
+    are written to the file_path.buffers file, every buffer is aligned to alignment bytes,
+    then load_obj_with_pickle_mmap can map them without copy.
+    bytes wrapped by pickle.PickleBuffer come back as memoryview. if min_bytes_size is set, all bytes/bytearray
+    not less than it come back as memoryview too, but don't use it when some objects are pickled with bytes
+    and need bytes to be restored, like the non-contiguous numpy arrays
+    """
+    payload = io.BytesIO()
+    with open(_get_buffer_file_path(file_path), 'wb') as buffer_file:
+        pickler = _MmapPickler(payload, buffer_file, alignment, min_bytes_size)
+        pickler.dump(obj)
+    with open(file_path, 'wb') as f:
+        pickle.dump({'buffer_table': pickler.buffer_table, 'out_of_band': pickler.out_of_band}, f)
+        f.write(payload.getbuffer())
+    return file_path
+
+
+def load_obj_with_pickle_mmap(file_path: str, writable: bool = False) -> object:
+    """
+    the buffers are the views of the memory mapped buffer file, so the processes loading the same file share
+    the same page cache. the big bytes/bytearray come back as memoryview.
+    if writable, the views are copy-on-write, writing them won't change the file
+    """
+    with open(file_path, 'rb') as f:
+        table = pickle.load(f)
+        views = []
+        if table['buffer_table']:
+            with open(_get_buffer_file_path(file_path), 'rb') as buffer_file:
+                # the mapping keeps alive as long as any view of it is alive, closing the file doesn't affect it
+                if os.fstat(buffer_file.fileno()).st_size:
+                    mapped = mmap.mmap(buffer_file.fileno(), 0,
+                                       access=mmap.ACCESS_COPY if writable else mmap.ACCESS_READ)
+                else:
+                    # all buffers are empty, an empty file can't be mapped
+                    mapped = bytearray() if writable else b''
+            view = memoryview(mapped)
+            views = [view[offset:offset + length] for offset, length in table['buffer_table']]
+        return _MmapUnpickler(f, views, table['out_of_band']).load()
+
+
+class Codec:
+    """a named compression setting, which can create compressor and decompressor objects with the same api
+    as zlib/lzma, that is, compressor.compress(), compressor.flush() and decompressor.decompress()"""
+    def __init__(self, name: str, backend: str, level: int = None, dictionary: bytes = None):
+        if backend not in codec_backends:
+            raise ValueError(f'{backend} no support, available backends: {list(codec_backends)}')
+        self.name = name
+        self.backend = backend
+        self.level = level
+        self.dictionary = dictionary
+
+    def compressobj(self, level: int = None):
+        compressobj_factory = codec_backends[self.backend][0]
+        return compressobj_factory(self.level if level is None else level, self.dictionary)
+
+    def decompressobj(self):
+        return codec_backends[self.backend][1](self.dictionary)
+
+    def compress(self, data: bytes, level: int = None) -> bytes:
+        compressor = self.compressobj(level)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        return self.decompressobj().decompress(data)
+
+    def header(self) -> bytes:
+        name = self.name.encode('ascii')
+        return codec_header_magic + bytes([len(name)]) + name
+
+
+def _no_dictionary(backend: str, dictionary: bytes) -> None:
+    if dictionary is not None:
+        raise ValueError(f'{backend} does not support dictionary')
+
+
+def _lzma_compressobj(level: int, dictionary: bytes):
+    _no_dictionary('lzma', dictionary)
+    return lzma.LZMACompressor(preset=level)
+
+
+def _lzma_decompressobj(dictionary: bytes):
+    return lzma.LZMADecompressor()
+
+
+def _zlib_compressobj(level: int, dictionary: bytes):
+    level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+    if dictionary is None:
+        return zlib.compressobj(level)
+    return zlib.compressobj(level, zdict=dictionary)
+
+
+def _zlib_decompressobj(dictionary: bytes):
+    if dictionary is None:
+        return zlib.decompressobj()
+    return zlib.decompressobj(zdict=dictionary)
+
+
+def _bz2_compressobj(level: int, dictionary: bytes):
+    _no_dictionary('bz2', dictionary)
+    return bz2.BZ2Compressor(9 if level is None else level)
+
+
+def _bz2_decompressobj(dictionary: bytes):
+    return bz2.BZ2Decompressor()
+
+
+def _zstd_compressobj(level: int, dictionary: bytes):
+    dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary is not None else None
+    return zstandard.ZstdCompressor(level=3 if level is None else level, dict_data=dict_data).compressobj()
+
+
+def _zstd_decompressobj(dictionary: bytes):
+    dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary is not None else None
+    return zstandard.ZstdDecompressor(dict_data=dict_data).decompressobj()
+
+
+class _Lz4Compressor:
+    """adapt lz4.frame.LZ4FrameCompressor, which needs begin() at first, to the zlib like api"""
+    def __init__(self, level: int):
+        self.compressor = lz4.frame.LZ4FrameCompressor(compression_level=0 if level is None else level)
+        self.begun = False
+
+    def compress(self, data: bytes) -> bytes:
+        header = b''
+        if not self.begun:
+            header = self.compressor.begin()
+            self.begun = True
+        return header + self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compress(b'') + self.compressor.flush()
+
+
+def _lz4_compressobj(level: int, dictionary: bytes):
+    _no_dictionary('lz4', dictionary)
+    return _Lz4Compressor(level)
+
+
+def _lz4_decompressobj(dictionary: bytes):
+    return lz4.frame.LZ4FrameDecompressor()
+
+
+"""
+codec_backends = {backend_name->str: (compressobj_factory(level, dictionary), decompressobj_factory(dictionary))}
+codecs = {codec_name->str: Codec, ...}
+"""
+codec_backends = {
+    'lzma': (_lzma_compressobj, _lzma_decompressobj),
+    'zlib': (_zlib_compressobj, _zlib_decompressobj),
+    'bz2': (_bz2_compressobj, _bz2_decompressobj),
+}
+if zstandard:
+    codec_backends['zstd'] = (_zstd_compressobj, _zstd_decompressobj)
+if lz4:
+    codec_backends['lz4'] = (_lz4_compressobj, _lz4_decompressobj)
+# the optional codecs are replaced by the stdlib codecs when their packages aren't installed
+codec_fallbacks = {'zstd': 'zlib', 'lz4': 'zlib'}
+codec_header_magic = b'PSPC'
+codecs = {}
+
+
+def register_codec_backend(name: str, compressobj_factory, decompressobj_factory) -> None:
+    codec_backends[name] = (compressobj_factory, decompressobj_factory)
+
+
+def register_codec(name: str, backend: str = None, level: int = None, dictionary: bytes = None) -> Codec:
+    """
+    register a codec by name, the name is written into the header of the compressed data,
+    so the data can be decompressed by any process which registers the same codec.
+    for example, register_codec('zstd-fast', 'zstd', level=1)
+    """
+    if not 0 < len(name.encode('ascii')) < 256:
+        raise ValueError('Codec name must be ascii, and its length must be between 1 and 255')
+    codec = Codec(name, backend or name, level, dictionary)
+    codecs[name] = codec
+    return codec
+
+
+for _backend in codec_backends:
+    register_codec(_backend)
+
+
+def get_codec(name: str) -> Codec:
+    if name not in codecs and name in codec_fallbacks:
+        name = codec_fallbacks[name]
+    try:
+        return codecs[name]
+    except KeyError:
+        raise ValueError(f'Codec {name} has not been registered, registered codecs: {list(codecs)}') from None
+
+
+def parse_codec_header(data: bytes) -> tuple[Codec | None, int]:
+    """return the codec and the header length, if data has no header, return (None, 0)"""
+    if not data[:len(codec_header_magic)] == codec_header_magic:
+        return None, 0
+    name_start = len(codec_header_magic) + 1
+    name_end = name_start + data[len(codec_header_magic)]
+    return get_codec(bytes(data[name_start:name_end]).decode('ascii')), name_end
+
+
+def compress_obj(obj: object, used_lib: str = 'lzma', level: int = None) -> bytes:
     # serializing python obj into byte stream using pickle
     serialized_obj = pickle.dumps(obj)
-    if used_lib == 'lzma':
-        # compress the byte stream using lzma
-        compressed_data = lzma.compress(serialized_obj)
-    elif used_lib == 'zlib':
-        compressed_data = zlib.compress(serialized_obj)
-    else:
-        raise ValueError(compress_error_info)
-    return compressed_data
+    codec = get_codec(used_lib)
+    # compress the byte stream, and put the header in front of it, so decompress_obj can know the used codec
+    return codec.header() + codec.compress(serialized_obj, level)
 
 
-def decompress_obj(compressed_data, used_lib='lzma') -> object:
-    if used_lib == 'lzma':
-        serialized_obj = lzma.decompress(compressed_data)
-    elif used_lib == 'zlib':
-        serialized_obj = zlib.decompress(compressed_data)
-    else:
-        raise ValueError(compress_error_info)
+def decompress_obj(compressed_data: bytes, used_lib: str = None) -> object:
+    """
+    used_lib is only used for the data without header, which is compressed by the older versions.
+    the data of compress_obj is a plain pickle, and the content of the file written by compress_and_store_obj
+    is the frames of _CompressedFrameWriter, both of them can be decompressed
+    """
+    codec, header_length = parse_codec_header(compressed_data)
+    if codec is None:
+        codec = get_codec(used_lib or 'lzma')
+    serialized_obj = codec.decompress(memoryview(compressed_data)[header_length:])
+    if serialized_obj[:1] == _pickle_frame:
+        return _load_frames(memoryview(serialized_obj))
     # deserialize
     obj = pickle.loads(serialized_obj)
     return obj
 
 
-def compress_and_store_obj(obj: object, file_path: str, used_lib: str = 'lzma') -> None:
+_frame_header = struct.Struct('<cQ')
+_pickle_frame = b'P'
+_buffer_frame = b'B'
+
+
+def _load_frames(data: memoryview) -> object:
+    """unpickle the frames of _CompressedFrameWriter in memory, a plain pickle starts with PROTO, not a frame type"""
+    pickle_data, buffers = [], []
+    pos = 0
+    while pos < len(data):
+        frame_type, length = _frame_header.unpack_from(data, pos)
+        pos += _frame_header.size
+        if pos + length > len(data) or frame_type not in (_pickle_frame, _buffer_frame):
+            raise pickle.UnpicklingError('The compressed frames are truncated or corrupted')
+        (pickle_data if frame_type == _pickle_frame else buffers).append(data[pos:pos + length])
+        pos += length
+    return pickle.loads(b''.join(pickle_data), buffers=buffers)
+
+
+class _CompressedFrameWriter:
+    """
+    file like object for pickle, every write of pickle is put into a frame,
+    and the out-of-band buffers of pickle protocol 5 are written as their own frames without copying them,
+    then all frames are compressed into the file.
+    frame: type(1 byte, P or B) + length(8 bytes) + data
+    """
+    def __init__(self, file, compressor, chunk_size: int = 1024 * 1024):
+        self.file = file
+        self.compressor = compressor
+        self.chunk_size = chunk_size
+
+    def _write_frame(self, frame_type: bytes, data) -> None:
+        data = memoryview(data).cast('B')
+        self.file.write(self.compressor.compress(_frame_header.pack(frame_type, data.nbytes)))
+        # compress big data piece by piece, to limit the size of every compressed output
+        for start in range(0, data.nbytes, self.chunk_size):
+            self.file.write(self.compressor.compress(data[start:start + self.chunk_size]))
+
+    def write(self, data) -> int:
+        self._write_frame(_pickle_frame, data)
+        return len(data)
+
+    def write_buffer(self, buffer: pickle.PickleBuffer) -> bool:
+        """used as buffer_callback of pickle, return False means the buffer is out-of-band"""
+        try:
+            data = buffer.raw()
+        except BufferError:
+            # non-contiguous buffer, let pickle serialize it in-band
+            return True
+        self._write_frame(_buffer_frame, data)
+        return False
+
+    def close(self) -> None:
+        self.file.write(self.compressor.flush())
+
+
+class _DecompressedFrameReader:
+    """
+    the counterpart of _CompressedFrameWriter, provides the pickle data to Unpickler,
+    and collects the out-of-band buffers on the way, they always come before the pickle data referencing them.
+    if the decompressed data is a plain pickle, which is written by compress_obj, it's read directly.
+    """
+    def __init__(self, file, decompressor, pending: bytes = b'', chunk_size: int = 1024 * 64):
+        self.file = file
+        self.decompressor = decompressor
+        self.pending = pending
+        self.chunk_size = chunk_size
+        self.support_max_length = True
+        self.chunk = b''
+        self.chunk_pos = 0
+        self.frame_remaining = 0
+        self.buffers = collections.deque()
+        self.plain = self._fill() and self.chunk[0] == pickle.PROTO[0]
+
+    def _decompress_some(self) -> bytes | None:
+        """return the next piece of decompressed data, which is limited to chunk_size if the decompressor supports,
+        so highly compressed data won't be expanded at once. None means the end"""
+        decompressor = self.decompressor
+        if getattr(decompressor, 'eof', False):
+            return None
+        if getattr(decompressor, 'unconsumed_tail', b''):
+            data = decompressor.unconsumed_tail
+        elif getattr(decompressor, 'needs_input', True):
+            data = self.pending or self.file.read(self.chunk_size)
+            self.pending = b''
+            if not data:
+                return None
+        else:
+            data = b''
+        if self.support_max_length:
+            try:
+                return decompressor.decompress(data, self.chunk_size)
+            except TypeError:
+                self.support_max_length = False
+        return decompressor.decompress(data)
+
+    def _fill(self) -> bool:
+        """make sure there is unconsumed decompressed data, return False at the end"""
+        while self.chunk_pos >= len(self.chunk):
+            chunk = self._decompress_some()
+            if chunk is None:
+                return False
+            self.chunk = chunk
+            self.chunk_pos = 0
+        return True
+
+    def _read_raw_into(self, view: memoryview) -> int:
+        got = 0
+        while got < len(view) and self._fill():
+            n = min(len(view) - got, len(self.chunk) - self.chunk_pos)
+            view[got:got + n] = self.chunk[self.chunk_pos:self.chunk_pos + n]
+            self.chunk_pos += n
+            got += n
+        return got
+
+    def _next_pickle_frame(self) -> bool:
+        header = bytearray(_frame_header.size)
+        while self._read_raw_into(memoryview(header)) == _frame_header.size:
+            frame_type, length = _frame_header.unpack(header)
+            if frame_type == _pickle_frame:
+                self.frame_remaining = length
+                return True
+            buffer = bytearray(length)
+            if self._read_raw_into(memoryview(buffer)) != length:
+                break
+            self.buffers.append(buffer)
+        return False
+
+    def readinto(self, b) -> int:
+        view = memoryview(b).cast('B')
+        if self.plain:
+            return self._read_raw_into(view)
+        got = 0
+        while got < len(view):
+            if not self.frame_remaining and not self._next_pickle_frame():
+                break
+            n = self._read_raw_into(view[got:got + min(len(view) - got, self.frame_remaining)])
+            self.frame_remaining -= n
+            got += n
+        return got
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            raise ValueError('Reading all data is not supported')
+        data = bytearray(size)
+        return bytes(data[:self.readinto(data)])
+
+    def readline(self) -> bytes:
+        line = bytearray()
+        while not line.endswith(b'\n'):
+            c = self.read(1)
+            if not c:
+                break
+            line += c
+        return bytes(line)
+
+    def iter_buffers(self):
+        while True:
+            try:
+                yield self.buffers.popleft()
+            except IndexError:
+                raise pickle.UnpicklingError('The out-of-band buffer is missing') from None
+
+
+@contextlib.contextmanager
+def trace_peak_memory():
+    """
+    with trace_peak_memory() as memory_info:
+        compress_and_store_obj(obj, file_path)
+    memory_info -> {'peak_memory': bytes->int, 'used_time': float}
+    """
+    memory_info = {}
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    t_start = time.time()
+    try:
+        yield memory_info
+    finally:
+        memory_info['used_time'] = time.time() - t_start
+        memory_info['peak_memory'] = tracemalloc.get_traced_memory()[1] - start_memory
+        if not was_tracing:
+            tracemalloc.stop()
+
+
+def compress_and_store_obj(obj: object, file_path: str, used_lib: str = 'lzma', level: int = None) -> None:
+    """
+    pickle the obj into the compressor directly, without the full copies of pickled and compressed data,
+    and the buffers of pickle protocol 5, like numpy arrays, are compressed without copying them.
+    the compressed content is the frames of _CompressedFrameWriter, not a plain pickle like compress_obj,
+    it can be read by load_and_decompress_obj, or decompress_obj with the data of the whole file
+    """
+    codec = get_codec(used_lib)
     with open(file_path, "wb") as f:
-        compressed_data = compress_obj(obj, used_lib)
-        f.write(compressed_data)
+        f.write(codec.header())
+        writer = _CompressedFrameWriter(f, codec.compressobj(level))
+        pickle.Pickler(writer, protocol=5, buffer_callback=writer.write_buffer).dump(obj)
+        writer.close()
 
 
-def load_and_decompress_obj(file_path: str, used_lib: str = 'lzma') -> object:
+def load_and_decompress_obj(file_path: str, used_lib: str = None) -> object:
+    """used_lib is only used for the file without header, which is written by the older versions"""
     with open(file_path, "rb") as f:
-        compressed_data = f.read()
-    return decompress_obj(compressed_data, used_lib)
+        head = f.read(len(codec_header_magic) + 256)
+        codec, header_length = parse_codec_header(head)
+        if codec is None:
+            codec = get_codec(used_lib or 'lzma')
+        reader = _DecompressedFrameReader(f, codec.decompressobj(), head[header_length:])
+        return pickle.Unpickler(reader, buffers=reader.iter_buffers()).load()
 
 
 def compress_file(file_list_or_dir: list | str, output_path: str, start_path: str = None) -> str:
     if isinstance(file_list_or_dir, str):
-        file_list_or_dir = file_util.get_files_in_dir(file_list_or_dir)
+        file_list_or_dir = file_util.walk_files(file_list_or_dir)
 
     with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
         for file_path in file_list_or_dir:
@@ -163,7 +900,174 @@ def extract_file(zip_file_path: str, extract_dir: str) -> str:
     return extract_dir
 
 
-def compress_file_lzma(input_file: str, output_file: str, chunk_size: int = 1024 * 1024 * 10):
+"""the files with these extensions are already compressed, so they are stored in zip without compressing again"""
+zip_stored_extensions = frozenset({
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.pdf',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.lzma', '.7z', '.rar', '.zst', '.lz4',
+    '.mp3', '.aac', '.ogg', '.flac', '.mp4', '.mkv', '.avi', '.mov', '.webm',
+    '.docx', '.xlsx', '.pptx', '.jar', '.whl', '.apk',
+})
+
+
+def _deflate_member(file_path: str, compresslevel: int, store: bool) -> tuple[int, int, int, bytes | None]:
+    """return (compress_type, crc, file_size, compressed_data), compressed_data is None if it should be stored,
+    then the file is copied to zip directly, instead of being sent back through the pipe"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    crc = zlib.crc32(data)
+    if not store:
+        # raw deflate stream, it's what zip uses
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+        compressed_data = compressor.compress(data) + compressor.flush()
+        if len(compressed_data) < len(data):
+            return zipfile.ZIP_DEFLATED, crc, len(data), compressed_data
+    return zipfile.ZIP_STORED, crc, len(data), None
+
+
+def _write_zip_member(zipf: zipfile.ZipFile, zinfo: zipfile.ZipInfo, write_data) -> None:
+    """
+    write a member whose crc and sizes are known already, so the local header is written before the data,
+    and no data descriptor is needed even if the output isn't seekable.
+    it follows what ZipFile._open_to_write() and _ZipWriteFile.close() do, zipfile has no public api for it
+    """
+    if zipf._seekable:
+        zipf.fp.seek(zipf.start_dir)
+    zinfo.header_offset = zipf.fp.tell()
+    zipf._writecheck(zinfo)
+    zipf._didModify = True
+    zipf.fp.write(zinfo.FileHeader(None))
+    write_data(zipf.fp)
+    zipf.start_dir = zipf.fp.tell()
+    zipf.filelist.append(zinfo)
+    zipf.NameToInfo[zinfo.filename] = zinfo
+
+
+def compress_file_multiprocessing(file_list_or_dir: list | str, output_path_or_file, start_path: str = None,
+                                  num_processes: int = multiprocessing.cpu_count(), compresslevel: int = 6,
+                                  stored_extensions: frozenset = zip_stored_extensions,
+                                  max_member_size: int = 1024 * 1024 * 256, max_queue_length: int = 100,
+                                  show_progress_bar: bool = False, max_pending_size: int = 1024 * 1024 * 512) -> dict:
+    """
+    like compress_file, but the members are deflated in a process pool, and written to zip in order.
+    the files with stored_extensions are stored without compressing,
+    the files larger than max_member_size are compressed by the main process in streaming when it's their turn,
+    to avoid holding them in memory.
+    at most max_queue_length members, and the members of at most max_pending_size bytes in total (at least one),
+    are submitted and not written yet, so the compressed data held in memory is bounded by bytes.
+    output_path_or_file can be a path or a writable file object, even a non-seekable one, ZIP64 is used when needed.
+    """
+    t_start = time.time()
+    if isinstance(file_list_or_dir, str):
+        file_list_or_dir = file_util.walk_files(file_list_or_dir)
+    file_list = list(file_list_or_dir)
+    total_size = sum(os.path.getsize(file_path) for file_path in file_list)
+
+    def _write_result(zipf: zipfile.ZipFile, file_path: str, future) -> None:
+        arcname = os.path.relpath(file_path, start_path) if start_path else None
+        if future is None:
+            zipf.write(file_path, arcname=arcname, compress_type=zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+            return
+        compress_type, crc, file_size, compressed_data = future.result()
+        zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+        zinfo.compress_type = compress_type
+        zinfo.CRC = crc
+        zinfo.file_size = file_size
+        if compressed_data is None:
+            zinfo.compress_size = file_size
+
+            def write_data(fp) -> None:
+                with open(file_path, 'rb') as f:
+                    shutil.copyfileobj(f, fp, 1024 * 1024)
+        else:
+            zinfo.compress_size = len(compressed_data)
+
+            def write_data(fp) -> None:
+                fp.write(compressed_data)
+        _write_zip_member(zipf, zinfo, write_data)
+
+    written_size = 0
+    if show_progress_bar:
+        progress_bar(0)
+    with zipfile.ZipFile(output_path_or_file, 'w', zipfile.ZIP_DEFLATED) as zipf, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=max(num_processes, 1)) as executor:
+        # [(file path, size of the file in memory, future or None), ...]
+        pending = collections.deque()
+        pending_size = 0
+        for file_path in file_list + [None]:
+            size = os.path.getsize(file_path) if file_path is not None else 0
+            # the big files are compressed by the main process in streaming, they aren't held in memory
+            streaming = size > max_member_size
+            if streaming:
+                size = 0
+            while pending and (file_path is None or len(pending) >= max_queue_length
+                               or pending_size + size > max_pending_size):
+                done_path, done_size, future = pending.popleft()
+                _write_result(zipf, done_path, future)
+                pending_size -= done_size
+                written_size += os.path.getsize(done_path)
+                if show_progress_bar and total_size:
+                    progress_bar(written_size / total_size)
+            if file_path is None:
+                break
+            if streaming:
+                pending.append((file_path, 0, None))
+            else:
+                store = os.path.splitext(file_path)[1].lower() in stored_extensions
+                pending.append((file_path, size, executor.submit(_deflate_member, file_path, compresslevel, store)))
+                pending_size += size
+    if show_progress_bar:
+        progress_bar(1)
+        print()
+    used_time = time.time() - t_start
+    output_path = os.path.abspath(output_path_or_file) if isinstance(output_path_or_file, str) else None
+    return {'output_path': output_path, 'used_time': used_time,
+            'compress_ratio': os.path.getsize(output_path) / total_size if output_path and total_size else None,
+            'throughput': total_size / 1024 / 1024 / used_time}
+
+
+def _extract_members(zip_file_path: str, extract_dir: str, names: list) -> None:
+    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+        for name in names:
+            try:
+                zip_ref.extract(name, extract_dir)
+            except FileExistsError:
+                # another worker created the same directory between the check and the creation of zipfile
+                zip_ref.extract(name, extract_dir)
+
+
+def extract_file_multiprocessing(zip_file_path: str, extract_dir: str,
+                                 num_processes: int = multiprocessing.cpu_count()) -> str:
+    """
+    the members are divided into num_processes groups of about the same compressed size,
+    every worker opens the zip by itself and extracts a group
+    """
+    if not os.path.exists(extract_dir):
+        os.makedirs(extract_dir)
+    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+        infos = sorted(zip_ref.infolist(), key=lambda info: info.compress_size, reverse=True)
+    num_processes = max(min(num_processes, len(infos)), 1)
+    # give the biggest member to the group with the least size every time
+    groups = [(0, i, []) for i in range(num_processes)]
+    for info in infos:
+        size, i, names = heapq.heappop(groups)
+        names.append(info.filename)
+        heapq.heappush(groups, (size + info.compress_size, i, names))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor:
+        futures = [executor.submit(_extract_members, zip_file_path, extract_dir, names)
+                   for _, _, names in groups if names]
+        for future in futures:
+            future.result()
+    return extract_dir
+
+
+def compress_file_lzma(input_file: str, output_file: str, chunk_size: int = 1024 * 1024 * 10,
+                       resumable: bool = False):
+    """if resumable, the file is compressed to the chunked streams with a manifest,
+    see compress_file_multiprocessing_lzma"""
+    if resumable:
+        return compress_file_multiprocessing_lzma(input_file, output_file, num_processes=1, chunk_size=chunk_size,
+                                                  resumable=True)
+    _remove_lzma_manifest(output_file)
     with open(input_file, 'rb') as f_in:
         with lzma.open(output_file, 'wb') as f_out:
             while True:
@@ -183,77 +1087,354 @@ def decompress_file_lzma(input_file: str, output_file: str, chunk_size: int = 10
                 f_out.write(chunk)
 
 
-def _compress_chunk(input_path: str, chunk_size: int, shared_offsets: list, shared_data: dict,
-                    max_queue_length: int = 100, sleep_time: float = 0.1) -> None:
-    while True:
-        try:
-            offset = shared_offsets.pop(0)
-        except IndexError:
+def _compress_chunk(input_path: str, offset: int, chunk_size: int, preset: int = None) -> tuple[bytes, int]:
+    """return the compressed data and the crc32 of the original data"""
+    with open(input_path, 'rb') as file:
+        file.seek(offset)
+        data = file.read(chunk_size)
+    return lzma.compress(data, preset=preset), zlib.crc32(data)
+
+
+def get_lzma_manifest_path(output_path: str) -> str:
+    return f'{output_path}.manifest.jsonl'
+
+
+def _remove_lzma_manifest(output_path: str) -> None:
+    """the output is rewritten without a manifest, the manifest of the last resumable run doesn't describe it"""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(get_lzma_manifest_path(output_path))
+
+
+def _get_lzma_manifest_header(input_path: str, chunk_size: int) -> dict:
+    stat = os.stat(input_path)
+    return {'input_size': stat.st_size, 'input_mtime_ns': stat.st_mtime_ns, 'chunk_size': chunk_size}
+
+
+def _load_lzma_manifest(manifest_path: str) -> tuple[dict | None, list[dict], bool]:
+    """
+    manifest: the first record is the header, then a record for every written chunk, and a complete record at last.
+    if a chunk is recorded more than once, which is left by the older versions after resuming, the last one is used.
+    :return: (header, [{'offset', 'compressed_offset', 'compressed_size', 'crc32', 'compressed_crc32'}, ...]
+              sorted by offset, complete)
+    """
+    records = iter(JsonLinesStore(manifest_path))
+    header = next(records, None)
+    chunks = {}
+    complete = False
+    for record in records:
+        if record.get('complete'):
+            complete = True
             break
-        with open(input_path, 'rb') as file:
-            file.seek(offset)
-            data = file.read(chunk_size)
-        compressed_data = lzma.compress(data)
-        shared_data[offset] = compressed_data
-        while True:
-            if len(shared_data) < max_queue_length:
-                break
-            else:
-                time.sleep(sleep_time)
+        chunks[record['offset']] = record
+    return header, [chunks[offset] for offset in sorted(chunks)], complete
 
 
-def _write_compressed_data(output_path: str, file_size: int, chunk_size: int, shared_data: dict,
-                           sleep_time: float = 0.1, show_progress_bar: bool = False) -> None:
-    if show_progress_bar:
-        progress_bar(0)
-    with open(output_path, 'wb') as compressed_file:
-        offset = 0
-        while offset < file_size:
-            if offset in shared_data:
-                compressed_file.write(shared_data[offset])
-                del shared_data[offset]
-                offset += chunk_size
-                if show_progress_bar:
-                    progress_bar(offset / file_size)
-            else:
-                time.sleep(sleep_time)
-        if show_progress_bar:
-            progress_bar(1)
-            print()
+def _get_resumable_chunks(input_path: str, output_path: str, chunk_size: int) -> tuple[list[dict], bool]:
+    """return the chunks which are written correctly, and whether the compression is complete,
+    if the manifest doesn't match the input file, return ([], False) to start over"""
+    manifest_path = get_lzma_manifest_path(output_path)
+    if not os.path.exists(manifest_path) or not os.path.exists(output_path):
+        return [], False
+    header, chunks, complete = _load_lzma_manifest(manifest_path)
+    if header != _get_lzma_manifest_header(input_path, chunk_size):
+        return [], False
+    # only the continuous chunks from the beginning can be used
+    valid_chunks = []
+    for i, chunk in enumerate(chunks):
+        previous_end = valid_chunks[-1]['compressed_offset'] + valid_chunks[-1]['compressed_size'] if i else 0
+        if chunk['offset'] != i * chunk_size or chunk['compressed_offset'] != previous_end:
+            break
+        valid_chunks.append(chunk)
+    # the output must contain all recorded chunks, and check the last one has been written completely
+    while valid_chunks:
+        last = valid_chunks[-1]
+        if os.path.getsize(output_path) >= last['compressed_offset'] + last['compressed_size']:
+            with open(output_path, 'rb') as f:
+                f.seek(last['compressed_offset'])
+                if zlib.crc32(f.read(last['compressed_size'])) == last['compressed_crc32']:
+                    break
+        valid_chunks.pop()
+        complete = False
+    return valid_chunks, complete and len(valid_chunks) == len(chunks)
 
 
 def compress_file_multiprocessing_lzma(input_path: str, output_path: str,
                                        num_processes: int = multiprocessing.cpu_count(),
                                        chunk_size: int = 1024 * 1024 * 10, max_queue_length: int = 100,
-                                       sleep_time: float = 0.1, show_progress_bar: bool = False) -> dict:
+                                       sleep_time: float = 0.1, show_progress_bar: bool = False, preset: int = None,
+                                       resumable: bool = False) -> dict:
     """
     basic idea:
-        1.block the file in advance, and save the offset to a list shared by multiple processes
-        2.create a multi-process compressing function, and each function read the first value in the shared list,
-            then delete it, and reads data from the offset value from the file.In total, read a block size of data.
-            Then compress it and put it in a shared dict
-        3.create a write process, and read the compressed data from the shared dict by offset order,
-            and write it to file, until the offset value is greater than or equal to the file size.
+        1.block the file in advance by offset, every block will be compressed to an independent xz stream,
+            so the output is the concatenated xz streams, which can be decompressed by lzma directly
+        2.the workers in a process pool read the block from the file by themselves, so only the compressed data
+            is sent back through the pool's pipe
+        3.the main process submits the blocks in order and writes the results in the same order, the number of
+            the blocks in flight is limited by max_queue_length, so when the writing is slower than compressing,
+            the submitting will wait for the oldest block, instead of polling
+    if resumable, after a block is written and synced to disk, its offsets and checksums are appended to
+    the manifest next to the output, see get_lzma_manifest_path(). when it's called again after being interrupted,
+    the output is truncated to the last good block, and the compression continues from the next block.
+    sleep_time isn't used since there is no polling, it's kept for the positional arguments of the older versions.
     """
 
     t_start = time.time()
     file_size = os.path.getsize(input_path)
-    shared_offsets = multiprocessing.Manager().list(range(0, file_size, chunk_size))
-    if len(shared_offsets) < num_processes:
-        num_processes = len(shared_offsets)
-    shared_data = multiprocessing.Manager().dict()
-
-    write_process = multiprocessing.Process(target=_write_compressed_data, args=(
-        output_path, file_size, chunk_size, shared_data, sleep_time, show_progress_bar))
-
-    compress_processes = [
-        multiprocessing.Process(target=_compress_chunk, args=(input_path, chunk_size, shared_offsets, shared_data,
-                                                              max_queue_length, sleep_time)) for _ in
-        range(num_processes)]
-    processes = [write_process, *compress_processes]
-    for process in processes:
-        process.start()
-    for process in processes:
-        process.join()
-    return {'output_path': os.path.abspath(output_path), 'used_time': time.time() - t_start,
-            'compress_ratio': os.path.getsize(output_path) / file_size}
+    manifest = None
+    done_chunks = []
+    if resumable:
+        done_chunks, complete = _get_resumable_chunks(input_path, output_path, chunk_size)
+        manifest = JsonLinesStore(get_lzma_manifest_path(output_path))
+        if complete:
+            return {'output_path': os.path.abspath(output_path), 'used_time': time.time() - t_start,
+                    'compress_ratio': os.path.getsize(output_path) / file_size if file_size else 0,
+                    'throughput': 0, 'resumed_offset': file_size}
+        # rewrite the manifest with only the good chunks, the records of the dropped ones mustn't stay in it
+        temp_manifest = JsonLinesStore(f'{manifest.file_path}.tmp')
+        temp_manifest.clear()
+        temp_manifest.extend([_get_lzma_manifest_header(input_path, chunk_size)] + done_chunks)
+        os.replace(temp_manifest.file_path, manifest.file_path)
+    else:
+        _remove_lzma_manifest(output_path)
+    resumed_offset = len(done_chunks) * chunk_size
+    offsets = range(resumed_offset, file_size, chunk_size)
+    num_processes = max(min(num_processes, len(offsets)), 1)
+    max_queue_length = max(max_queue_length, num_processes)
+
+    def _write_chunk(offset: int, future) -> None:
+        compressed_data, crc = future.result()
+        compressed_offset = compressed_file.tell()
+        compressed_file.write(compressed_data)
+        if manifest:
+            # the chunk must be on the disk before the manifest says it's done
+            compressed_file.flush()
+            os.fsync(compressed_file.fileno())
+            manifest.append({'offset': offset, 'compressed_offset': compressed_offset,
+                             'compressed_size': len(compressed_data), 'crc32': crc,
+                             'compressed_crc32': zlib.crc32(compressed_data)})
+        if show_progress_bar:
+            progress_bar(min(offset + chunk_size, file_size) / file_size)
+
+    if show_progress_bar:
+        progress_bar(resumed_offset / file_size if file_size else 0)
+    with open(output_path, 'r+b' if done_chunks else 'wb') as compressed_file, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor:
+        if done_chunks:
+            compressed_file.truncate(done_chunks[-1]['compressed_offset'] + done_chunks[-1]['compressed_size'])
+            compressed_file.seek(0, os.SEEK_END)
+        pending = collections.deque()
+        for offset in offsets:
+            if len(pending) >= max_queue_length:
+                _write_chunk(*pending.popleft())
+            pending.append((offset, executor.submit(_compress_chunk, input_path, offset, chunk_size, preset)))
+        while pending:
+            _write_chunk(*pending.popleft())
+    if manifest:
+        manifest.append({'complete': True})
+    if show_progress_bar:
+        progress_bar(1)
+        print()
+    used_time = time.time() - t_start
+    return {'output_path': os.path.abspath(output_path), 'used_time': used_time,
+            'compress_ratio': os.path.getsize(output_path) / file_size if file_size else 0,
+            'throughput': (file_size - resumed_offset) / 1024 / 1024 / used_time, 'resumed_offset': resumed_offset}
+
+
+def _verify_chunk(input_path: str, offset: int, size: int) -> int:
+    """decompress the xz stream, which checks its own integrity, and return the crc32 of the data"""
+    with open(input_path, 'rb') as f:
+        f.seek(offset)
+        return zlib.crc32(lzma.decompress(f.read(size), format=lzma.FORMAT_XZ))
+
+
+def _get_complete_manifest_chunks(input_path: str) -> list[dict] | None:
+    """the chunks in the manifest of the compressed file, or None if there is no manifest, or it's incomplete,
+    or its chunks don't cover the file continuously, then it's not the manifest of this file"""
+    manifest_path = get_lzma_manifest_path(input_path)
+    if not os.path.exists(manifest_path):
+        return None
+    header, chunks, complete = _load_lzma_manifest(manifest_path)
+    if not header or not complete:
+        return None
+    end = 0
+    for i, chunk in enumerate(chunks):
+        if chunk['offset'] != i * header['chunk_size'] or chunk['compressed_offset'] != end:
+            return None
+        end += chunk['compressed_size']
+    if end != os.path.getsize(input_path):
+        return None
+    return chunks
+
+
+def verify_file_multiprocessing_lzma(input_path: str, num_processes: int = multiprocessing.cpu_count()) -> dict:
+    """
+    check the compressed file chunk by chunk in parallel. if the complete manifest written by the resumable mode
+    exists, and its chunks end at the end of the file, the chunks are located by it, and their crc32 are compared with the recorded ones,
+    or the chunks are located by the xz index, and only the integrity check of xz is done,
+    then ValueError is raised if the index itself is broken.
+    :return: {'ok': bool, 'checked_chunks': int, 'bad_chunks': [compressed_offset, ...]}
+    """
+    chunks = _get_complete_manifest_chunks(input_path)
+    if chunks is not None:
+        chunks = [(chunk['compressed_offset'], chunk['compressed_size'], chunk['crc32']) for chunk in chunks]
+    else:
+        chunks = [(stream['offset'], stream['size'], None) for stream in get_lzma_stream_index(input_path)]
+
+    bad_chunks = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(min(num_processes, len(chunks)), 1)) as executor:
+        futures = [executor.submit(_verify_chunk, input_path, offset, size) for offset, size, _ in chunks]
+        for (offset, _, crc), future in zip(chunks, futures):
+            try:
+                data_crc = future.result()
+            except (lzma.LZMAError, EOFError):
+                bad_chunks.append(offset)
+                continue
+            if crc is not None and data_crc != crc:
+                bad_chunks.append(offset)
+    return {'ok': not bad_chunks, 'checked_chunks': len(chunks), 'bad_chunks': bad_chunks}
+
+
+_xz_header_magic = b'\xfd7zXZ\x00'
+_xz_footer_magic = b'YZ'
+_xz_header_or_footer_size = 12
+
+
+def _read_xz_varint(data: bytes, pos: int) -> tuple[int, int]:
+    """read a multibyte integer of the xz format, return the value and the position after it"""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+        if shift >= 63:
+            raise ValueError('Invalid xz multibyte integer')
+
+
+def get_lzma_stream_index(input_path: str) -> list[dict]:
+    """
+    walk the concatenated xz streams from the end of the file, using the native footer and index of every stream,
+    so no extra trailer is needed, and the files written by compress_file_lzma also can be read.
+    :return: [{'offset': int, 'size': int, 'uncompressed_offset': int, 'uncompressed_size': int}, ...] in file order
+    """
+    streams = []
+    with open(input_path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            f.seek(end - 4)
+            # skip the stream padding, it's null bytes in multiples of four
+            if f.read(4) == b'\x00' * 4:
+                end -= 4
+                continue
+            if end < _xz_header_or_footer_size * 2:
+                raise ValueError(f'{input_path} is not a valid xz file')
+            f.seek(end - _xz_header_or_footer_size)
+            footer = f.read(_xz_header_or_footer_size)
+            if footer[-2:] != _xz_footer_magic:
+                raise ValueError(f'{input_path} is not a valid xz file')
+            index_size = (int.from_bytes(footer[4:8], 'little') + 1) * 4
+            index_start = end - _xz_header_or_footer_size - index_size
+            f.seek(index_start)
+            index = f.read(index_size)
+            if index[0] != 0x00 or zlib.crc32(index[:-4]) != int.from_bytes(index[-4:], 'little'):
+                raise ValueError(f'{input_path} has a broken xz index at {index_start}')
+            number_of_records, pos = _read_xz_varint(index, 1)
+            blocks_size = 0
+            uncompressed_size = 0
+            for _ in range(number_of_records):
+                unpadded_size, pos = _read_xz_varint(index, pos)
+                block_uncompressed_size, pos = _read_xz_varint(index, pos)
+                blocks_size += (unpadded_size + 3) & ~3
+                uncompressed_size += block_uncompressed_size
+            start = index_start - blocks_size - _xz_header_or_footer_size
+            f.seek(start)
+            if start < 0 or f.read(len(_xz_header_magic)) != _xz_header_magic:
+                raise ValueError(f'{input_path} has a broken xz stream before {end}')
+            streams.append({'offset': start, 'size': end - start, 'uncompressed_size': uncompressed_size})
+            end = start
+    streams.reverse()
+    uncompressed_offset = 0
+    for stream in streams:
+        stream['uncompressed_offset'] = uncompressed_offset
+        uncompressed_offset += stream['uncompressed_size']
+    return streams
+
+
+def _read_xz_stream(input_path: str, stream: dict) -> bytes:
+    with open(input_path, 'rb') as f:
+        f.seek(stream['offset'])
+        return f.read(stream['size'])
+
+
+def _decompress_stream(input_path: str, output_path: str, stream: dict, chunk_size: int = 1024 * 1024) -> None:
+    """decompress the stream to its position of the output file by pieces of at most chunk_size,
+    so a big stream doesn't need to be held in memory, neither the compressed nor the decompressed data"""
+    decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+    with open(input_path, 'rb') as f_in, open(output_path, 'r+b') as f_out:
+        f_in.seek(stream['offset'])
+        f_out.seek(stream['uncompressed_offset'])
+        remaining = stream['size']
+        while not decompressor.eof:
+            if decompressor.needs_input:
+                data = f_in.read(min(chunk_size, remaining))
+                if not data:
+                    raise EOFError(f'the xz stream at {stream["offset"]} of {input_path} is truncated')
+                remaining -= len(data)
+            else:
+                data = b''
+            f_out.write(decompressor.decompress(data, chunk_size))
+
+
+def decompress_file_multiprocessing_lzma(input_path: str, output_path: str,
+                                         num_processes: int = multiprocessing.cpu_count(),
+                                         show_progress_bar: bool = False) -> dict:
+    """
+    the counterpart of compress_file_multiprocessing_lzma, every xz stream is decompressed by a worker,
+    and written to its own position of the output file directly, which is preallocated to the uncompressed size
+    """
+    t_start = time.time()
+    streams = get_lzma_stream_index(input_path)
+    file_size = sum(stream['uncompressed_size'] for stream in streams)
+    with open(output_path, 'wb') as f:
+        f.truncate(file_size)
+    num_processes = max(min(num_processes, len(streams)), 1)
+
+    if show_progress_bar:
+        progress_bar(0)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor:
+        futures = [executor.submit(_decompress_stream, input_path, output_path, stream) for stream in streams]
+        for count, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            future.result()
+            if show_progress_bar:
+                progress_bar(count / len(futures))
+    if show_progress_bar:
+        print()
+    used_time = time.time() - t_start
+    return {'output_path': os.path.abspath(output_path), 'used_time': used_time,
+            'throughput': file_size / 1024 / 1024 / used_time}
+
+
+def read_range_lzma(input_path: str, start: int, length: int, index: list[dict] = None) -> bytes:
+    """
+    read the uncompressed data in [start, start + length) from concatenated xz streams,
+    only the streams overlapping the range will be decompressed.
+    index can be given by get_lzma_stream_index() in advance, to avoid walking the file on every read
+    """
+    if index is None:
+        index = get_lzma_stream_index(input_path)
+    end = start + length
+    uncompressed_offsets = [stream['uncompressed_offset'] for stream in index]
+    data = []
+    for i in range(max(bisect.bisect_right(uncompressed_offsets, start) - 1, 0), len(index)):
+        stream = index[i]
+        if stream['uncompressed_offset'] >= end:
+            break
+        # only decompress to the end of the range, so a read at the head of a big stream stays cheap
+        decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+        stream_data = decompressor.decompress(_read_xz_stream(input_path, stream),
+                                              max_length=end - stream['uncompressed_offset'])
+        data.append(stream_data[max(start - stream['uncompressed_offset'], 0):])
+    return b''.join(data)
@@ -1,11 +1,31 @@
+import array
+import collections
+import concurrent.futures
+import ctypes
+import ctypes.util
 import datetime
+import errno
+import functools
 import hashlib
+import itertools
+import mmap
 import os
+import pickle
 import re
+import select
 import shutil
+import sqlite3
+import struct
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 import interact_util
-import other_util
 
 win_reserved_names_list = [
     'CON', 'PRN', 'AUX', 'NUL',
@@ -13,48 +33,77 @@ win_reserved_names_list = [
     'LPT1', 'LPT2', 'LPT3', 'LPT4', 'LPT5', 'LPT6', 'LPT7', 'LPT8', 'LPT9',
     'CONIN$', 'CONOUT$', 'NUL', 'PRN',
 ]
+win_reserved_names = frozenset(win_reserved_names_list)
 added_reserved_suffix = '_win'
 
 
 def recursive_splitext(name_with_ext: str) -> str:
-    name = os.path.splitext(name_with_ext)
-    if not name[1]:
-        return name[0]
-    else:
-        return recursive_splitext(name[0])
+    """the name without all the extensions, the leading dots are kept like os.path.splitext, e.g. '.a.b.c' -> '.a'"""
+    stem = name_with_ext.lstrip('.')
+    dot_index = stem.find('.')
+    if dot_index == -1:
+        return name_with_ext
+    return name_with_ext[:len(name_with_ext) - len(stem) + dot_index]
+
+
+@functools.lru_cache(maxsize=1024 * 64)
+def _process_win_reserved_component(component: str, restore: bool) -> (bool, str):
+    # 所有名称只保留第一个"."前的名字
+    name = recursive_splitext(component)
+    # 使用 find() 方法查找第一个点号的位置
+    dot_index = component.find('.')
+    if dot_index == -1:
+        dot_index = len(component)
+    if not restore:
+        if name.upper() in win_reserved_names:
+            # 在点号之前插入文本
+            return True, component[:dot_index] + added_reserved_suffix + component[dot_index:]
+    elif name.endswith(added_reserved_suffix):
+        original_name = name[:-len(added_reserved_suffix)]
+        if original_name.upper() in win_reserved_names:
+            # 原名接上点号后的文本
+            return True, original_name + component[dot_index:]
+    return False, component
 
 
 def process_win_reserved_name(path: str, restore: bool) -> (bool, str):
     # 使用os.path.normpath()规范化路径
     normalized_path = os.path.normpath(path)
-    # 拆分路径成各级文件夹
+    # 拆分路径成各级文件夹，每个名称的结果都被缓存，因为相同的文件夹名在很多路径中重复出现
     folders = normalized_path.split(os.sep)
 
     flag = False
-    # 检查每个文件夹名称是否是保留名称
     for i in range(len(folders)):
-        # 所有名称只保留第一个"."前的名字
-        name = recursive_splitext(folders[i])
-        # 使用 find() 方法查找第一个点号的位置
-        dot_index = folders[i].find('.')
-        if dot_index == -1:
-            dot_index = len(folders[i])
-        if not restore:
-            if name.upper() in win_reserved_names_list:
-                flag = True
-                # 在点号之前插入文本
-                folders[i] = folders[i][:dot_index] + added_reserved_suffix + folders[i][dot_index:]
-        else:
-            if name.endswith(added_reserved_suffix):
-                original_name = name[:-len(added_reserved_suffix)]
-                if original_name.upper() in win_reserved_names_list:
-                    flag = True
-                    # 原名接上点号后的文本
-                    folders[i] = original_name + folders[i][dot_index:]
+        changed, folders[i] = _process_win_reserved_component(folders[i], restore)
+        flag = flag or changed
 
     return flag, os.sep.join(folders)
 
 
+def process_win_reserved_names_in_dir(directory: str, restore: bool = False, dry_run: bool = False) -> dict:
+    """
+    rename the files and directories with the windows reserved names in the directory (not the directory itself),
+    or restore them if restore. it works bottom-up, the children are renamed before their parent directory,
+    so the paths walked are still valid. if the new name has existed, it's renamed like rename_duplicate_file.
+    if dry_run, nothing is renamed.
+    :return: {old_path: new_path}, the paths are under the original parent directories
+    """
+    renamed_dict = {}
+    for root, dirs, files in os.walk(directory, topdown=False):
+        for names, is_file in ((files, True), (dirs, False)):
+            for name in names:
+                changed, new_name = _process_win_reserved_component(name, restore)
+                if not changed:
+                    continue
+                old_path, new_path = os.path.join(root, name), os.path.join(root, new_name)
+                if not dry_run:
+                    # the new file name is reserved by an empty file, then replaced by the renamed one
+                    new_path = rename_duplicate_file(new_path, reserve=is_file)
+                    os.replace(old_path, new_path) if is_file else os.rename(old_path, new_path)
+                renamed_dict[old_path] = new_path
+    return renamed_dict
+
+
 def read_text_in_file(file_path: str, encoding: str = 'utf-8'):
     with open(file_path, encoding=encoding) as file:
         content = file.read()
@@ -69,7 +118,7 @@ def base_dir(__file__, relpath: str = '') -> str:
 def create_dir(dir_path: str) -> str:
     """if directory doesn't exist, then create it"""
     if not os.path.exists(dir_path):
-        os.makedirs(dir_path)
+        os.makedirs(dir_path, exist_ok=True)
     return dir_path
 
 
@@ -83,30 +132,212 @@ def create_file(file_path: str) -> str:
     return file_path
 
 
-def rename_duplicate_file(file_path: str) -> str:
-    """if file name has existed, add (n) after the file name and return, or return the origin name"""
-    count = 1
+_duplicate_suffix_pattern = re.compile(r"\(\d+\)$")
+# {(dir path, basename without (n), ext): the next n to try}
+_duplicate_counters = {}
+_duplicate_counters_lock = threading.Lock()
+_duplicate_counters_max_length = 10000
+
+
+def _try_create_file(file_path: str) -> bool:
+    try:
+        os.close(os.open(file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+        return True
+    except FileExistsError:
+        return False
+
+
+def _scan_max_duplicate_count(dir_path: str, basename: str, ext: str) -> int:
+    pattern = re.compile(rf'{re.escape(os.path.basename(basename))}\((\d+)\){re.escape(ext)}')
+    max_count = 0
+    with os.scandir(dir_path or '.') as it:
+        for entry in it:
+            match = pattern.fullmatch(entry.name)
+            if match:
+                max_count = max(max_count, int(match.group(1)))
+    return max_count
+
+
+def rename_duplicate_file(file_path: str, reserve: bool = False, scan: bool = False) -> str:
+    """
+    if file name has existed, add (n) after the file name and return, or return the origin name.
+    if scan, the directory is scanned to start from the largest existing n, instead of probing from (1).
+    if reserve, the empty file is created by O_CREAT | O_EXCL, so the name is unique even among the processes,
+    and the next n of every name is cached, so it doesn't probe from (1) every time,
+    or the name may be taken by others before it's created, and the same name is returned until it's created.
+    """
+    exists = (lambda path: not _try_create_file(path)) if reserve else os.path.exists
+    if not exists(file_path):
+        return file_path
+    basename, ext = os.path.splitext(file_path)
+    basename = _duplicate_suffix_pattern.sub('', basename)
+    key = (os.path.abspath(os.path.dirname(basename)), os.path.basename(basename), ext)
+    # without reserve, the returned name isn't taken, so the cache of the next n would skip it in the next call
+    with _duplicate_counters_lock:
+        count = _duplicate_counters.get(key) if reserve else None
+    if count is None:
+        count = _scan_max_duplicate_count(os.path.dirname(basename), basename, ext) + 1 if scan else 1
     while True:
-        if os.path.exists(file_path):
-            basename, ext = os.path.splitext(file_path)
-            basename = re.sub(r"\(\d+\)$", "", basename)
-            file_path = f'{basename}({count}){ext}'
-        else:
-            return file_path
-        count = count + 1
+        file_path = f'{basename}({count}){ext}'
+        count += 1
+        if not exists(file_path):
+            break
+    if not reserve:
+        return file_path
+    with _duplicate_counters_lock:
+        if len(_duplicate_counters) >= _duplicate_counters_max_length:
+            _duplicate_counters.clear()
+        _duplicate_counters[key] = max(count, _duplicate_counters.get(key, 0))
+    return file_path
 
 
 def copy_file(src_path: str, dst_path: str) -> str:
     """copy file, if dst dir doesn't exist, create it, if dst file has existed, rename it"""
     create_dir(os.path.dirname(dst_path))
-    # if dst file has existed, rename it
-    dst_path = rename_duplicate_file(dst_path)
-    # copy
-    shutil.copy2(src_path, dst_path)
+    # if dst file has existed, rename it, the new name is reserved, so the concurrent copies won't overwrite each other
+    dst_path = rename_duplicate_file(dst_path, reserve=True)
+    try:
+        _fast_copy_file(src_path, dst_path)
+    except BaseException:
+        os.remove(dst_path)
+        raise
     return dst_path
 
 
-def get_current_time_as_file_name(ext: str, format_str: str = None) -> str:
+# the ioctl request of linux to share the data blocks of two files (reflink) on btrfs, xfs, etc.
+FICLONE = 0x40049409
+# {(src device, dst device)} the devices don't support reflink or copy_file_range
+_reflink_unsupported = set()
+_copy_file_range_unsupported = set()
+
+
+def _fast_copy_file(src_path: str, dst_path: str) -> str:
+    """
+    copy the data by reflink, or os.copy_file_range, or shutil.copyfileobj, the first one works, then copy the stat.
+    the data is copied to a temp file then replaces dst_path, so if dst_path is a hard link of src_path,
+    it won't be truncated with the src data, and an interrupted copy won't leave a partial dst file.
+    :return: the method used, 'reflink' | 'copy_file_range' | 'copy'
+    """
+    temp_path = f'{dst_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        method = _fast_copy_data(src_path, temp_path)
+        shutil.copystat(src_path, temp_path)
+        os.replace(temp_path, dst_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return method
+
+
+def _fast_copy_data(src_path: str, dst_path: str) -> str:
+    with open(src_path, 'rb') as f_src, open(dst_path, 'wb') as f_dst:
+        devices = (os.fstat(f_src.fileno()).st_dev, os.fstat(f_dst.fileno()).st_dev)
+        method = 'copy'
+        if fcntl and devices not in _reflink_unsupported:
+            try:
+                fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+                method = 'reflink'
+            except OSError:
+                _reflink_unsupported.add(devices)
+        if method == 'copy' and hasattr(os, 'copy_file_range') and devices not in _copy_file_range_unsupported:
+            try:
+                size = os.fstat(f_src.fileno()).st_size
+                copied = 0
+                # the files like /proc/cpuinfo report size 0, or copy_file_range may return 0 before size,
+                # then the rest is copied by copyfileobj from where it stops, like shutil gives up its fast paths
+                while copied < size:
+                    length = os.copy_file_range(f_src.fileno(), f_dst.fileno(), size - copied)
+                    if not length:
+                        break
+                    copied += length
+                if size and copied == size:
+                    method = 'copy_file_range'
+                else:
+                    f_src.seek(copied)
+                    f_dst.seek(copied)
+            except OSError:
+                _copy_file_range_unsupported.add(devices)
+                f_src.seek(0)
+                f_dst.seek(0)
+                f_dst.truncate()
+        if method == 'copy':
+            shutil.copyfileobj(f_src, f_dst, 1024 * 1024)
+    return method
+
+
+def _copy_one(src_path: str, dst_path: str, hard_link: bool, rename_duplicate: bool) -> tuple[str, str, int]:
+    create_dir(os.path.dirname(dst_path) or '.')
+    if rename_duplicate:
+        dst_path = rename_duplicate_file(dst_path, reserve=True)
+    size = os.path.getsize(src_path)
+    if hard_link:
+        # link to a temp name then replace, so the existing or reserved file is overwritten atomically
+        temp_path = f'{dst_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.link(src_path, temp_path)
+            os.replace(temp_path, dst_path)
+            return dst_path, 'hard_link', size
+        except OSError:
+            # cross device, or the filesystem doesn't support hard links
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return dst_path, _fast_copy_file(src_path, dst_path), size
+
+
+def copy_many(src_dst_pairs, workers: int = None, hard_link: bool = False, rename_duplicate: bool = True,
+              show_progress_bar: bool = False, max_queue_length: int = 1000) -> dict:
+    """
+    copy many files in a thread pool, by reflink or os.copy_file_range if the filesystem supports.
+    if hard_link, the files on the same filesystem are hard linked instead of copied, they share the content.
+    if rename_duplicate, the existing dst files are kept and the new ones are renamed like copy_file,
+    or the dst files are overwritten.
+    :return: {'dst_paths': [dst_path, ...] in the order of src_dst_pairs, 'file_count': int, 'total_bytes': int,
+              'used_time': float, 'throughput': MB/s->float,
+              'methods': {'reflink' | 'copy_file_range' | 'copy' | 'hard_link': file count}}
+    """
+    t_start = time.time()
+    if show_progress_bar:
+        src_dst_pairs = list(src_dst_pairs)
+        interact_util.progress_bar(0)
+    result = {'dst_paths': [], 'file_count': 0, 'total_bytes': 0, 'used_time': 0, 'throughput': 0, 'methods': {}}
+    last_report_time = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for pair in itertools.chain(src_dst_pairs, [None]):
+            while pending and (len(pending) >= max_queue_length or pair is None):
+                dst_path, method, size = pending.popleft().result()
+                result['dst_paths'].append(dst_path)
+                result['file_count'] += 1
+                result['total_bytes'] += size
+                result['methods'][method] = result['methods'].get(method, 0) + 1
+                if show_progress_bar and time.monotonic() - last_report_time >= 0.1:
+                    last_report_time = time.monotonic()
+                    interact_util.progress_bar(result['file_count'] / len(src_dst_pairs))
+            if pair is None:
+                break
+            pending.append(executor.submit(_copy_one, *pair, hard_link, rename_duplicate))
+    if show_progress_bar:
+        interact_util.progress_bar(1)
+        print()
+    result['used_time'] = time.time() - t_start
+    result['throughput'] = result['total_bytes'] / 1024 / 1024 / result['used_time'] if result['used_time'] else 0
+    return result
+
+
+def copy_tree_parallel(src_dir: str, dst_dir: str, workers: int = None, hard_link: bool = False,
+                       exclude_dir_names: list = None, show_progress_bar: bool = False) -> dict:
+    """
+    copy the files in src_dir to dst_dir with copy_many, the existing files are overwritten,
+    the files are copied while src_dir is still being walked, the empty directories aren't copied.
+    :return: see copy_many
+    """
+    src_dst_pairs = ((os.path.join(src_dir, rel_path), os.path.join(dst_dir, rel_path))
+                     for rel_path in walk_files(src_dir, exclude_dir_names=exclude_dir_names, return_rel_path=True))
+    return copy_many(src_dst_pairs, workers, hard_link, rename_duplicate=False, show_progress_bar=show_progress_bar)
+
+
+def get_current_time_as_file_name(ext: str, format_str: str = None, reserve: bool = False) -> str:
     """generate file name according to the current time"""
     if not format_str:
         format_str = "%Y%m%d_%H%M%S_%f"
@@ -116,7 +347,7 @@ def get_current_time_as_file_name(ext: str, format_str: str = None) -> str:
             file_name = f'{file_name}{ext}'
         else:
             file_name = f'{file_name}.{ext}'
-    return rename_duplicate_file(file_name)
+    return rename_duplicate_file(file_name, reserve=reserve)
 
 
 def get_file_size(file_path: str, ignore_not_exist: bool = False) -> int:
@@ -132,26 +363,420 @@ def get_file_size(file_path: str, ignore_not_exist: bool = False) -> int:
             raise FileNotFoundError
 
 
+def _build_path_matcher(substrings: list = None, compiled_regexes: list = None):
+    """
+    combine the substrings and the regexes into as few regexes as possible,
+    :return: a function(path) -> bool, whether the path contains any substring or matches any regex, or None if empty
+    """
+    matchers = []
+    if substrings:
+        # the longer first, so the alternation won't stop at a shorter prefix
+        pattern = '|'.join(re.escape(substring) for substring in sorted(set(substrings), key=len, reverse=True))
+        matchers.append(re.compile(pattern).search)
+    if compiled_regexes:
+        # the groups are renumbered in a combined pattern, which breaks the backreferences
+        if len({regex.flags for regex in compiled_regexes}) == 1 and not any(regex.groups for regex in compiled_regexes):
+            pattern = '|'.join(f'(?:{regex.pattern})' for regex in compiled_regexes)
+            matchers.append(re.compile(pattern, compiled_regexes[0].flags).match)
+        else:
+            matchers.extend(regex.match for regex in compiled_regexes)
+    if not matchers:
+        return None
+    if len(matchers) == 1:
+        return lambda path: matchers[0](path) is not None
+    return lambda path: any(matcher(path) is not None for matcher in matchers)
+
+
+def walk_files(directory: str, exclude_relpath: list = None, exclude_abspath: list = None,
+               exclude_abspath_match_compiled_regex: list = None, exclude_dir_names: list = None,
+               exclude_dir_match_compiled_regex: list = None, return_rel_path: bool = False,
+               return_entry: bool = False, follow_symlinks: bool = False, workers: int = None):
+    """
+    like get_files_in_dir, but it's a generator, and the directories are scanned by os.scandir in a thread pool,
+    while the files are still yielded in the same order as os.walk (top-down, the files before the subdirectories).
+    the directories are pruned before scanning if their path contains exclude_relpath (joined with directory)
+    or exclude_abspath, their name is in exclude_dir_names, or their path matches exclude_dir_match_compiled_regex,
+    exclude_abspath_match_compiled_regex is only matched with the file paths.
+    if return_entry, os.DirEntry is yielded instead of the path, its stat is cached by itself.
+    the directories can't be read are skipped like os.walk. if workers is 1, it's scanned in the current thread.
+    """
+    substrings = [os.path.join(directory, p) for p in exclude_relpath or []] + list(exclude_abspath or [])
+    path_excluded = _build_path_matcher(substrings)
+    file_excluded = _build_path_matcher(substrings, exclude_abspath_match_compiled_regex)
+    dir_excluded = _build_path_matcher(None, exclude_dir_match_compiled_regex)
+    exclude_dir_names = frozenset(exclude_dir_names or ())
+    prefix_length = len(os.path.join(directory, ''))
+
+    def _scan(dir_path: str) -> tuple[list, list]:
+        files, dirs = [], []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if (entry.name in exclude_dir_names or (not follow_symlinks and entry.is_symlink())
+                                or (path_excluded and path_excluded(entry.path))
+                                or (dir_excluded and dir_excluded(entry.path))):
+                            continue
+                        dirs.append(entry.path)
+                    elif not (file_excluded and file_excluded(entry.path)):
+                        files.append(entry if return_entry else
+                                     entry.path[prefix_length:] if return_rel_path else entry.path)
+        except OSError:
+            pass
+        return files, dirs
+
+    if workers == 1:
+        stack = [directory]
+        while stack:
+            files, dirs = _scan(stack.pop())
+            yield from files
+            stack.extend(reversed(dirs))
+        return
+    # the default of ThreadPoolExecutor
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        # [dir path, future of its scan or None], the subdirectories are scanned ahead of the preorder yielding,
+        # the nearest to be yielded first, but at most a few scans for every worker are in flight at once
+        stack = [[directory, None]]
+        while stack:
+            in_flight = 0
+            for item in reversed(stack):
+                if in_flight >= workers * 4:
+                    break
+                if item[1] is None:
+                    item[1] = executor.submit(_scan, item[0])
+                in_flight += 1
+            files, dirs = stack.pop()[1].result()
+            yield from files
+            stack.extend([dir_path, None] for dir_path in reversed(dirs))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
 def get_files_in_dir(directory: str, exclude_relpath: list = None, exclude_abspath: list = None,
-                     exclude_abspath_match_compiled_regex: list = None, return_rel_path: bool = False) -> list:
-    def _check(path: str) -> bool:
-        has_rel = exclude_relpath and any(os.path.join(directory, p) in path for p in exclude_relpath)
-        has_abs = exclude_abspath and any(p in path for p in exclude_abspath)
-        has_match = exclude_abspath_match_compiled_regex and any(
-            compiled_regex.match(path) for compiled_regex in exclude_abspath_match_compiled_regex)
-        if not has_rel and not has_abs and not has_match:
-            return True
-
-    file_list = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            file_abspath = os.path.join(root, file)
-            if _check(file_abspath):
-                file_list.append(file_abspath)
-    if return_rel_path:
-        for i in range(len(file_list)):
-            file_list[i] = file_list[i].replace(directory + '\\', '')
-    return file_list
+                     exclude_abspath_match_compiled_regex: list = None, return_rel_path: bool = False,
+                     exclude_dir_names: list = None, exclude_dir_match_compiled_regex: list = None,
+                     workers: int = None) -> list:
+    """the list of walk_files, in the same order as os.walk"""
+    return list(walk_files(directory, exclude_relpath, exclude_abspath, exclude_abspath_match_compiled_regex,
+                           exclude_dir_names, exclude_dir_match_compiled_regex, return_rel_path, workers=workers))
+
+
+class DirSnapshot:
+    """
+    the (size, mtime_ns, inode) of every file in the directory, scan() compares the directory with it,
+    so only the changed files need to be processed again.
+    if index_path is given, the snapshot is loaded from it and saved to it after every scan,
+    the index stores the relative paths joined by NUL and the stats in an int64 array, pickled.
+    exclude_dir_names and exclude_abspath_match_compiled_regex are passed to walk_files.
+    """
+    index_version = 1
+
+    def __init__(self, directory: str, index_path: str = None, exclude_dir_names: list = None,
+                 exclude_abspath_match_compiled_regex: list = None, workers: int = None):
+        self.directory = os.path.abspath(directory)
+        self.index_path = index_path
+        self.exclude_dir_names = frozenset(exclude_dir_names or ())
+        self.exclude_abspath_match_compiled_regex = exclude_abspath_match_compiled_regex
+        self.workers = workers
+        self.file_excluded = _build_path_matcher(None, exclude_abspath_match_compiled_regex)
+        # {file_path: (size, mtime_ns, inode)}
+        self.entries = {}
+        if index_path and os.path.exists(index_path):
+            self.load()
+
+    @staticmethod
+    def empty_changes() -> dict:
+        """:return: a new empty changes dict, {'added': set, 'modified': set, 'removed': set} of the file paths"""
+        return {'added': set(), 'modified': set(), 'removed': set()}
+
+    def walk(self, directory: str = None):
+        """a generator yields (file_path, (size, mtime_ns, inode)) of the files in the directory now"""
+        for entry in walk_files(directory or self.directory, exclude_dir_names=self.exclude_dir_names,
+                                exclude_abspath_match_compiled_regex=self.exclude_abspath_match_compiled_regex,
+                                return_entry=True, workers=self.workers):
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            yield entry.path, (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    def update(self, file_path: str, changes: dict) -> None:
+        """stat the file again, and record the change of it in changes"""
+        try:
+            stat = os.stat(file_path, follow_symlinks=False)
+            file_stat = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        except FileNotFoundError:
+            file_stat = None
+        old_file_stat = self.entries.get(file_path)
+        if file_stat == old_file_stat:
+            return
+        if file_stat is None:
+            del self.entries[file_path]
+            if file_path in changes['added']:
+                changes['added'].discard(file_path)
+            else:
+                changes['modified'].discard(file_path)
+                changes['removed'].add(file_path)
+            return
+        self.entries[file_path] = file_stat
+        if old_file_stat is None and file_path not in changes['removed']:
+            changes['added'].add(file_path)
+        elif file_path not in changes['added']:
+            changes['removed'].discard(file_path)
+            changes['modified'].add(file_path)
+
+    @staticmethod
+    def merge_changes(changes: dict, new_changes: dict) -> dict:
+        """merge the later new_changes into changes, e.g. the file added then modified is still added"""
+        for file_path in new_changes['added']:
+            if file_path in changes['removed']:
+                changes['removed'].discard(file_path)
+                changes['modified'].add(file_path)
+            else:
+                changes['added'].add(file_path)
+        changes['modified'].update(new_changes['modified'] - changes['added'])
+        for file_path in new_changes['removed']:
+            if file_path in changes['added']:
+                changes['added'].discard(file_path)
+            else:
+                changes['modified'].discard(file_path)
+                changes['removed'].add(file_path)
+        return changes
+
+    def scan(self) -> dict:
+        """walk the whole directory, update the snapshot, see empty_changes for the return"""
+        changes = self.empty_changes()
+        entries = dict(self.walk())
+        for file_path, file_stat in entries.items():
+            old_file_stat = self.entries.get(file_path)
+            if old_file_stat is None:
+                changes['added'].add(file_path)
+            elif old_file_stat != file_stat:
+                changes['modified'].add(file_path)
+        changes['removed'] = self.entries.keys() - entries.keys()
+        self.entries = entries
+        if self.index_path:
+            self.save()
+        return changes
+
+    def save(self, index_path: str = None) -> str:
+        index_path = index_path or self.index_path
+        prefix_length = len(os.path.join(self.directory, ''))
+        stats = array.array('q')
+        for file_stat in self.entries.values():
+            stats.extend(file_stat)
+        index = {'version': self.index_version, 'directory': self.directory,
+                 'paths': '\0'.join(file_path[prefix_length:] for file_path in self.entries), 'stats': stats}
+        if os.path.dirname(index_path):
+            create_dir(os.path.dirname(index_path))
+        temp_path = f'{index_path}.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, index_path)
+        return index_path
+
+    def load(self, index_path: str = None) -> dict:
+        with open(index_path or self.index_path, 'rb') as f:
+            index = pickle.load(f)
+        if index['version'] != self.index_version or index['directory'] != self.directory:
+            raise ValueError(f'{index_path or self.index_path} isn\'t the index of {self.directory}')
+        stats = index['stats']
+        paths = index['paths'].split('\0') if index['paths'] else []
+        self.entries = {os.path.join(self.directory, path): tuple(stats[i * 3:i * 3 + 3])
+                        for i, path in enumerate(paths)}
+        return self.entries
+
+    def watch(self) -> 'DirWatcher':
+        return DirWatcher(self)
+
+
+class DirWatcher:
+    """
+    keep the DirSnapshot up to date by inotify (linux only), without walking the directory again.
+    poll() returns the changes since the last poll, in the same form as DirSnapshot.scan.
+    if the events overflow the inotify queue, the directory is scanned again.
+    the snapshot isn't saved automatically, call snapshot.save() when needed.
+    """
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x1000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    watch_mask = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                  | IN_DELETE_SELF | IN_ONLYDIR)
+    event_header = struct.Struct('iIII')
+
+    def __init__(self, snapshot: DirSnapshot):
+        if not sys.platform.startswith('linux'):
+            raise NotImplementedError('DirWatcher needs inotify, it only works on linux')
+        self.snapshot = snapshot
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        # {watch descriptor: directory path}
+        self.watches = {}
+        self.pending_changes = snapshot.empty_changes()
+        self._add_watches(snapshot.directory)
+        if not snapshot.entries:
+            snapshot.entries = dict(snapshot.walk())
+
+    def _add_watch(self, dir_path: str) -> None:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), self.watch_mask)
+        if wd < 0:
+            # it may be removed already, the events of its parent handle it
+            if ctypes.get_errno() in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()), dir_path)
+        self.watches[wd] = dir_path
+
+    def _add_watches(self, directory: str) -> None:
+        self._add_watch(directory)
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [d for d in dirs if d not in self.snapshot.exclude_dir_names]
+            for d in dirs:
+                self._add_watch(os.path.join(root, d))
+
+    def _remove_dir(self, dir_path: str, changes: dict) -> None:
+        prefix = os.path.join(dir_path, '')
+        # the watches of a moved directory still report the old paths, so remove them
+        for wd, watched_path in list(self.watches.items()):
+            if watched_path == dir_path or watched_path.startswith(prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+        for file_path in [file_path for file_path in self.snapshot.entries if file_path.startswith(prefix)]:
+            self.snapshot.update(file_path, changes)
+
+    def _handle_event(self, wd: int, mask: int, name: str, changes: dict) -> None:
+        dir_path = self.watches.get(wd)
+        if dir_path is None:
+            return
+        if mask & self.IN_IGNORED:
+            del self.watches[wd]
+            return
+        if not name:
+            return
+        path = os.path.join(dir_path, name)
+        if mask & self.IN_ISDIR:
+            if name in self.snapshot.exclude_dir_names:
+                return
+            if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                # the files may be created before the watches are added, so walk it after adding
+                self._add_watches(path)
+                for file_path, file_stat in self.snapshot.walk(path):
+                    self.snapshot.update(file_path, changes)
+            elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                self._remove_dir(path, changes)
+        elif not (self.snapshot.file_excluded and self.snapshot.file_excluded(path)):
+            self.snapshot.update(path, changes)
+
+    def poll(self, timeout: float = None) -> dict:
+        """wait the events up to timeout seconds (None means forever, 0 means don't wait)"""
+        changes = self.pending_changes
+        self.pending_changes = self.snapshot.empty_changes()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        while readable:
+            try:
+                data = os.read(self.fd, 1024 * 64)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = self.event_header.unpack_from(data, offset)
+                offset += self.event_header.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    for wd in list(self.watches):
+                        self.libc.inotify_rm_watch(self.fd, wd)
+                    self.watches.clear()
+                    self._add_watches(self.snapshot.directory)
+                    self.snapshot.merge_changes(changes, self.snapshot.scan())
+                    continue
+                self._handle_event(wd, mask, name, changes)
+        return changes
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class HashCache:
+    """
+    persistent file hash cache in sqlite, keyed by (path, size, mtime_ns, inode) of the file,
+    the stored digest is returned only if all of them are unchanged, or the file will be hashed again.
+    the stat should be taken before hashing, so a file changed during hashing won't be cached as unchanged.
+    """
+    def __init__(self, db_path: str, commit_every: int = 1000):
+        if os.path.dirname(db_path):
+            create_dir(os.path.dirname(db_path))
+        self.db_path = db_path
+        self.commit_every = commit_every
+        self.uncommitted_count = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS file_hash (path TEXT, algorithm TEXT, size INTEGER, '
+                                'mtime_ns INTEGER, inode INTEGER, digest TEXT, PRIMARY KEY (path, algorithm))')
+        self.connection.commit()
+
+    def get(self, file_path: str, hash_algorithm: str, stat: os.stat_result = None) -> str | None:
+        stat = stat or os.stat(file_path)
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT digest FROM file_hash WHERE path = ? AND algorithm = ? AND size = ? AND mtime_ns = ? '
+                'AND inode = ?', (os.path.abspath(file_path), hash_algorithm, stat.st_size, stat.st_mtime_ns,
+                                  stat.st_ino)).fetchone()
+        return row[0] if row else None
+
+    def set(self, file_path: str, hash_algorithm: str, digest: str, stat: os.stat_result) -> None:
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO file_hash VALUES (?, ?, ?, ?, ?, ?)',
+                                    (os.path.abspath(file_path), hash_algorithm, stat.st_size, stat.st_mtime_ns,
+                                     stat.st_ino, digest))
+            self.uncommitted_count += 1
+            if self.uncommitted_count >= self.commit_every:
+                self._commit()
+
+    def _commit(self) -> None:
+        self.connection.commit()
+        self.uncommitted_count = 0
+
+    def commit(self) -> None:
+        with self.lock:
+            self._commit()
+
+    def close(self) -> None:
+        self.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 
 class PyHash:
@@ -163,48 +788,489 @@ class PyHash:
     blake2s = 'blake2s'
     hash_algorithms_list = [md5, sha1, sha256, sha512, blake2b, blake2s]
 
-    def __init__(self, hash_algorithm: str, show_rate_of_progress: bool = False):
+    def __init__(self, hash_algorithm: str, show_rate_of_progress: bool = False, cache: HashCache | str = None):
+        """
+        if cache is given, the file hashes are cached in it, it can be a HashCache or the path of its db,
+        the new hashes are committed in batches, call close() or use PyHash as a context manager to commit the rest,
+        the cache created from the path is closed too, the given HashCache is left to its owner
+        """
         if type(hash_algorithm) == str and hash_algorithm in self.hash_algorithms_list:
-            self.hash_algorithm = eval(f'hashlib.{hash_algorithm}()')
+            self.hash_algorithm_name = hash_algorithm
+            # the hash object of the last calculation
+            self.hash_algorithm = hashlib.new(hash_algorithm)
         else:
             raise ValueError(f'{hash_algorithm} no support')
         self.show_rate_of_progress = show_rate_of_progress
+        self._own_cache = isinstance(cache, str)
+        self.cache = HashCache(cache) if self._own_cache else cache
+
+    def close(self) -> None:
+        if self._own_cache:
+            self.cache.close()
+            self.cache = None
+            self._own_cache = False
+        elif self.cache:
+            self.cache.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _new_hash(self):
+        """every calculation uses a new hash object, so the state won't be chained across calculations"""
+        self.hash_algorithm = hashlib.new(self.hash_algorithm_name)
+        return self.hash_algorithm
 
     def cal_data_hash(self, data: object, encoding: str = 'utf-8') -> str:
         data = str(data).encode(encoding=encoding)
-        self.hash_algorithm.update(data)
+        self._new_hash().update(data)
         return self.hash_algorithm.hexdigest()
 
-    def cal_file_hash(self, file_path: str, block_size: int = 1024 * 1024 * 10) -> str:
-        if self.show_rate_of_progress:
-            file_size = get_file_size(file_path)
+    def cal_file_hash(self, file_path: str, block_size: int = 1024 * 1024 * 10, progress_callback=None,
+                      progress_interval: float = 0.1) -> str:
+        """
+        if block_size is 0, the whole file is mapped by mmap and hashed at once.
+        progress_callback(done_bytes, total_bytes) is called at most once per progress_interval seconds,
+        and once at the end, if show_rate_of_progress and no callback, a progress bar is shown
+        """
+        if self.cache:
+            stat = os.stat(file_path)
+            digest = self.cache.get(file_path, self.hash_algorithm_name, stat)
+            if digest is None:
+                digest = self._cal_file_hash(file_path, block_size, progress_callback, progress_interval)
+                self.cache.set(file_path, self.hash_algorithm_name, digest, stat)
+            return digest
+        return self._cal_file_hash(file_path, block_size, progress_callback, progress_interval)
+
+    def _cal_file_hash(self, file_path: str, block_size: int, progress_callback, progress_interval: float) -> str:
+        self._new_hash()
+        show_progress_bar = self.show_rate_of_progress and not progress_callback
+        if show_progress_bar:
+            def progress_callback(done_bytes: int, total_bytes: int) -> None:
+                interact_util.progress_bar(progress=done_bytes / total_bytes if total_bytes else 1)
         with open(file_path, "rb") as f:
-            if block_size:
-                if self.show_rate_of_progress:
-                    count = 0
-                while True:
-                    data = f.read(block_size)
-                    if not data:
-                        break
-                    self.hash_algorithm.update(data)
-                    if self.show_rate_of_progress:
-                        count += block_size
-                        interact_util.progress_bar(progress=count / file_size)
-                if self.show_rate_of_progress:
-                    print()
+            if block_size and not progress_callback and hasattr(hashlib, 'file_digest'):
+                # python 3.11+, it does the same readinto loop as update_hash_from_file
+                self.hash_algorithm = hashlib.file_digest(f, lambda: self.hash_algorithm)
             else:
-                data = f.read()
-                self.hash_algorithm.update(data)
+                update_hash_from_file(self.hash_algorithm, f, block_size, progress_callback, progress_interval)
+        if show_progress_bar:
+            print()
         return self.hash_algorithm.hexdigest()
 
 
+def update_hash_from_file(hash_obj, f, block_size: int = 1024 * 1024, progress_callback=None,
+                          progress_interval: float = 0.1) -> int:
+    """
+    feed the file to the hash object without allocating a new bytes object for every block,
+    the blocks are read into one reusable buffer by readinto, or if block_size is 0,
+    the whole file is mapped by mmap and fed at once.
+    :return: the number of bytes hashed
+    """
+    total_bytes = os.fstat(f.fileno()).st_size
+    done_bytes = 0
+    if not block_size:
+        if total_bytes:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hash_obj.update(mapped)
+            done_bytes = total_bytes
+    else:
+        buffer = bytearray(block_size)
+        view = memoryview(buffer)
+        last_report_time = time.monotonic()
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            hash_obj.update(view[:size])
+            done_bytes += size
+            if progress_callback and time.monotonic() - last_report_time >= progress_interval:
+                last_report_time = time.monotonic()
+                progress_callback(done_bytes, total_bytes)
+    if progress_callback:
+        progress_callback(done_bytes, total_bytes)
+    return done_bytes
+
+
+def _hash_file(file_path: str, hash_algorithm: str, block_size: int) -> tuple[str, str, int]:
+    hash_obj = hashlib.new(hash_algorithm)
+    with open(file_path, 'rb') as f:
+        size = update_hash_from_file(hash_obj, f, block_size)
+    return file_path, hash_obj.hexdigest(), size
+
+
+def hash_files(file_paths, hash_algorithm: str = PyHash.sha256, workers: int = None, use_process: bool = False,
+               block_size: int = 1024 * 1024, stats: dict = None, cache: HashCache | str = None):
+    """
+    calculate the hash of many files, every file has its own hash object.
+    the files are read in a thread pool by default, hashlib releases the GIL when hashing the big data,
+    or in a process pool if use_process.
+    it's a generator yields (file_path, hexdigest) in the order of completion.
+    if cache is given, the unchanged files are taken from it without reading, see HashCache.
+    if stats dict is given, it's updated with
+        {'file_count': int, 'cached_count': int, 'total_bytes': int, 'used_time': float, 'throughput': MB/s->float}
+    """
+    if hash_algorithm not in PyHash.hash_algorithms_list:
+        raise ValueError(f'{hash_algorithm} no support')
+    workers = workers or os.cpu_count()
+    # the cache created here is closed here, the given one is only committed
+    own_cache = isinstance(cache, str)
+    if own_cache:
+        cache = HashCache(cache)
+    stats = {} if stats is None else stats
+    stats.update({'file_count': 0, 'cached_count': 0, 'total_bytes': 0, 'used_time': 0, 'throughput': 0})
+    t_start = time.perf_counter()
+
+    def _count(size: int) -> None:
+        stats['file_count'] += 1
+        stats['total_bytes'] += size
+        stats['used_time'] = time.perf_counter() - t_start
+        stats['throughput'] = stats['total_bytes'] / 1024 / 1024 / stats['used_time'] if stats['used_time'] else 0
+
+    executor_class = concurrent.futures.ProcessPoolExecutor if use_process else concurrent.futures.ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        file_paths = iter(file_paths)
+        # {future: stat of the file before hashing}
+        pending = {}
+        try:
+            while True:
+                # keep a few tasks for every worker, instead of submitting all files at once
+                while len(pending) < workers * 4:
+                    file_path = next(file_paths, None)
+                    if file_path is None:
+                        break
+                    stat = None
+                    if cache:
+                        stat = os.stat(file_path)
+                        digest = cache.get(file_path, hash_algorithm, stat)
+                        if digest is not None:
+                            stats['cached_count'] += 1
+                            _count(0)
+                            yield file_path, digest
+                            continue
+                    pending[executor.submit(_hash_file, file_path, hash_algorithm, block_size)] = stat
+                if not pending:
+                    break
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    stat = pending.pop(future)
+                    file_path, hexdigest, size = future.result()
+                    if cache:
+                        cache.set(file_path, hash_algorithm, hexdigest, stat)
+                    _count(size)
+                    yield file_path, hexdigest
+        finally:
+            if own_cache:
+                cache.close()
+            elif cache:
+                cache.commit()
+
+
+def _hash_file_sample(file_path: str, hash_algorithm: str, sample_size: int) -> tuple[str, str, bool]:
+    """
+    hash the first and last sample_size bytes of the file, if the file isn't bigger than 2 * sample_size,
+    the whole file is hashed, so the digest is the full digest of it.
+    :return: (file_path, hexdigest, is_full_digest)
+    """
+    hash_obj = hashlib.new(hash_algorithm)
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= sample_size * 2:
+            update_hash_from_file(hash_obj, f, sample_size)
+            return file_path, hash_obj.hexdigest(), True
+        hash_obj.update(f.read(sample_size))
+        f.seek(-sample_size, os.SEEK_END)
+        hash_obj.update(f.read(sample_size))
+    return file_path, hash_obj.hexdigest(), False
+
+
+def find_duplicate_files(file_paths_or_dir: list | str, hash_algorithm: str = PyHash.sha256,
+                         sample_size: int = 1024 * 64, min_size: int = 1, workers: int = None,
+                         cache: HashCache | str = None, stats: dict = None) -> dict:
+    """
+    find out the files with the same content, the files are narrowed down in stages,
+    only the files with the same size are sampled, only the files with the same size and sample
+    (the first and last sample_size bytes) are fully hashed, see hash_files for workers and cache.
+    the hard links of one file are hashed once, and reported as duplicates. if a file is only duplicated by its own
+    hard links, the shared inode proves they have the same content, so it isn't fully hashed,
+    and the group is keyed by 'inode:<device>:<inode>' instead of the hexdigest.
+    if stats dict is given, it's updated with
+        {'file_count': int, 'size_candidate_count': int, 'sample_candidate_count': int, 'hashed_bytes': int,
+         'duplicate_bytes': the bytes could be saved by keeping only one file of every group->int, 'used_time': float}
+    :return: {hexdigest1: [file_path1, file_path2, ...], hexdigest2: ..., ...}, like data_process.find_list_duplicates
+    """
+    if hash_algorithm not in PyHash.hash_algorithms_list:
+        raise ValueError(f'{hash_algorithm} no support')
+    if isinstance(file_paths_or_dir, str):
+        file_paths_or_dir = walk_files(file_paths_or_dir)
+    workers = workers or os.cpu_count()
+    stats = {} if stats is None else stats
+    stats.update({'file_count': 0, 'size_candidate_count': 0, 'sample_candidate_count': 0, 'hashed_bytes': 0,
+                  'duplicate_bytes': 0, 'used_time': 0})
+    t_start = time.time()
+    result = {}
+
+    def _add_hard_links(paths: list) -> None:
+        stat = os.stat(paths[0])
+        result[f'inode:{stat.st_dev}:{stat.st_ino}'] = sorted(paths)
+
+    # {size: {(device, inode): [file_path, its hard links...]}}
+    size_groups = {}
+    for file_path in file_paths_or_dir:
+        stat = os.stat(file_path)
+        stats['file_count'] += 1
+        if stat.st_size >= min_size:
+            size_groups.setdefault(stat.st_size, {}).setdefault((stat.st_dev, stat.st_ino), []).append(file_path)
+    # {representative path of the inode: all paths of the inode}
+    links = {}
+    for inodes in size_groups.values():
+        if len(inodes) > 1:
+            for paths in inodes.values():
+                links[paths[0]] = paths
+        elif len(next(iter(inodes.values()))) > 1:
+            _add_hard_links(next(iter(inodes.values())))
+    stats['size_candidate_count'] = len(links)
+
+    # {(size, digest): [file_path, ...]}
+    full_groups = {}
+    sample_groups = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for file_path, digest, is_full_digest in executor.map(
+                lambda path: _hash_file_sample(path, hash_algorithm, sample_size), links):
+            size = os.path.getsize(file_path)
+            stats['hashed_bytes'] += min(size, sample_size * 2)
+            (full_groups if is_full_digest else sample_groups).setdefault((size, digest), []).append(file_path)
+    candidates = []
+    for file_paths in sample_groups.values():
+        if len(file_paths) > 1:
+            candidates.extend(file_paths)
+        elif len(links[file_paths[0]]) > 1:
+            _add_hard_links(links[file_paths[0]])
+    stats['sample_candidate_count'] = len(candidates)
+    hash_stats = {}
+    for file_path, digest in hash_files(candidates, hash_algorithm, workers=workers, cache=cache, stats=hash_stats):
+        full_groups.setdefault((os.path.getsize(file_path), digest), []).append(file_path)
+    stats['hashed_bytes'] += hash_stats['total_bytes']
+
+    for (size, digest), file_paths in full_groups.items():
+        all_paths = [path for file_path in file_paths for path in links[file_path]]
+        if len(all_paths) > 1:
+            result[digest] = sorted(all_paths)
+            # the hard links don't take extra space
+            stats['duplicate_bytes'] += size * (len(file_paths) - 1)
+    stats['used_time'] = time.time() - t_start
+    return result
+
+
+# the random 64-bit value of every byte for the gear rolling hash
+_gear_table = tuple(int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'little') for i in range(256))
+
+
+def get_content_defined_chunks(file_path: str, min_size: int = 1024 * 2, avg_size: int = 1024 * 8,
+                               max_size: int = 1024 * 64):
+    """
+    split the file into chunks by the content with the gear rolling hash (like FastCDC),
+    the boundaries only depend on the nearby bytes, so the same content inserted or shifted in other files
+    still gets the same chunks. avg_size should be a power of 2.
+    it's pure python, about 10MB/s for a process, so find_partial_duplicate_files runs it in a process pool.
+    it's a generator yields (offset, size, chunk)
+    """
+    # the high bits of the gear hash depend on the last 64 bytes, about 1 / avg_size of the positions match
+    bits = max(avg_size.bit_length() - 1, 1)
+    mask = ((1 << bits) - 1) << (64 - bits)
+    gear_table = _gear_table
+    read_size = max_size * 16
+    with open(file_path, 'rb') as f:
+        data = f.read(read_size)
+        start = offset = 0
+        while start < len(data):
+            if len(data) - start < max_size:
+                more = f.read(read_size)
+                if more:
+                    data = data[start:] + more
+                    start = 0
+            end = min(start + max_size, len(data))
+            cut = end
+            h = 0
+            for i in range(start + min_size, end):
+                h = ((h << 1) + gear_table[data[i]]) & 0xFFFFFFFFFFFFFFFF
+                if not h & mask:
+                    cut = i + 1
+                    break
+            yield offset, cut - start, data[start:cut]
+            offset += cut - start
+            start = cut
+
+
+def _hash_content_defined_chunks(file_path: str, hash_algorithm: str, min_size: int, avg_size: int,
+                                 max_size: int) -> tuple[str, list]:
+    return file_path, [(offset, size, hashlib.new(hash_algorithm, chunk).hexdigest())
+                       for offset, size, chunk in get_content_defined_chunks(file_path, min_size, avg_size, max_size)]
+
+
+def find_partial_duplicate_files(file_paths_or_dir: list | str, hash_algorithm: str = PyHash.sha256,
+                                 min_size: int = 1024 * 2, avg_size: int = 1024 * 8, max_size: int = 1024 * 64,
+                                 num_processes: int = None, stats: dict = None) -> dict:
+    """
+    find out the content shared by the files, even if the files aren't the same, see get_content_defined_chunks.
+    if stats dict is given, it's updated with
+        {'file_count': int, 'chunk_count': int, 'total_bytes': int, 'duplicate_bytes': int, 'used_time': float}
+    :return: {chunk_hexdigest1: [(file_path1, offset1, size1), (file_path2, offset2, size2), ...], ...},
+        only the chunks appear more than once
+    """
+    if hash_algorithm not in PyHash.hash_algorithms_list:
+        raise ValueError(f'{hash_algorithm} no support')
+    if isinstance(file_paths_or_dir, str):
+        file_paths_or_dir = walk_files(file_paths_or_dir)
+    stats = {} if stats is None else stats
+    stats.update({'file_count': 0, 'chunk_count': 0, 'total_bytes': 0, 'duplicate_bytes': 0, 'used_time': 0})
+    t_start = time.time()
+    chunks = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor:
+        futures = [executor.submit(_hash_content_defined_chunks, file_path, hash_algorithm, min_size, avg_size,
+                                   max_size) for file_path in file_paths_or_dir]
+        for future in concurrent.futures.as_completed(futures):
+            file_path, file_chunks = future.result()
+            stats['file_count'] += 1
+            for offset, size, digest in file_chunks:
+                stats['chunk_count'] += 1
+                stats['total_bytes'] += size
+                chunks.setdefault(digest, []).append((file_path, offset, size))
+    result = {}
+    for digest, locations in chunks.items():
+        if len(locations) > 1:
+            result[digest] = sorted(locations)
+            stats['duplicate_bytes'] += locations[0][2] * (len(locations) - 1)
+    stats['used_time'] = time.time() - t_start
+    return result
+
+
 def get_current_user_dir() -> str:
     user_folder = os.path.expanduser('~')
     return user_folder
 
 
 def create_hard_link(new_file: str, original_file: str) -> str:
-    return other_util.run_command(f'mklink /h {new_file} {original_file}')
+    os.link(original_file, new_file)
+    return new_file
+
+
+def _get_device(path: str) -> int:
+    """the device of the path, or of its nearest existing parent if it doesn't exist"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev
+
+
+def _is_same_link(link_path: str, target_path: str, symbolic: bool) -> bool:
+    try:
+        if symbolic:
+            return os.path.islink(link_path) and os.readlink(link_path) == target_path
+        return os.path.samefile(link_path, target_path)
+    except OSError:
+        return False
+
+
+def build_link_farm(link_target_dict: dict, symbolic: bool = False, relative: bool = False,
+                    on_collision: str = 'skip', fallback_copy: bool = True, dry_run: bool = False) -> dict:
+    """
+    create the links of {link_path: target_path} by os.link, or os.symlink if symbolic,
+    the parent directories of the links are created if not exist.
+    if relative, the targets of the symbolic links are relative to the directories of the links.
+    on_collision decides what to do if link_path has existed (except it's already the same link):
+        'skip' | 'replace' (atomically) | 'rename' (like rename_duplicate_file) | 'error' (recorded in errors)
+    if fallback_copy, the hard links can't be created (cross device, too many links, not supported) are copied.
+    if dry_run, nothing is changed, the actions are only planned.
+    :return: {'actions': [(action, link_path, target_path), ...], 'errors': {link_path: error message},
+              'used_time': float, and the count of every action: 'link' | 'symlink' | 'copy' | 'exists' | 'skip'}
+        the action is 'replace' or 'rename' plus ' ' and 'link' | 'symlink' | 'copy' on collisions
+    """
+    if on_collision not in ('skip', 'replace', 'rename', 'error'):
+        raise ValueError(f'{on_collision} no support')
+    t_start = time.time()
+    result = {'actions': [], 'errors': {}, 'used_time': 0}
+    created_dirs = set()
+    # {directory of link: device}, to predict the cross device links in dry run
+    devices = {}
+    # the link paths planned in dry run, so the renamed ones don't plan the same name
+    planned_paths = set()
+
+    def _link(target: str, path: str, target_path: str) -> str:
+        if symbolic:
+            os.symlink(target, path)
+            return 'symlink'
+        try:
+            os.link(target_path, path)
+            return 'link'
+        except OSError as e:
+            if not fallback_copy or e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.ENOTSUP):
+                raise
+        _fast_copy_file(target_path, path)
+        return 'copy'
+
+    def _rename(link_path: str) -> str:
+        # like rename_duplicate_file, but a dangling symbolic link takes the name too, and nothing is created
+        # or cached, so the dry run plans the same names as the real run
+        basename, ext = os.path.splitext(link_path)
+        basename = _duplicate_suffix_pattern.sub('', basename)
+        count = 1
+        while os.path.lexists(f'{basename}({count}){ext}') or f'{basename}({count}){ext}' in planned_paths:
+            count += 1
+        return f'{basename}({count}){ext}'
+
+    def _plan_link(link_dir: str, target_path: str) -> str:
+        if symbolic:
+            return 'symlink'
+        if link_dir not in devices:
+            devices[link_dir] = _get_device(link_dir)
+        return 'link' if not fallback_copy or devices[link_dir] == os.stat(target_path).st_dev else 'copy'
+
+    for link_path, target_path in link_target_dict.items():
+        link_dir = os.path.dirname(link_path) or '.'
+        target = os.path.relpath(target_path, link_dir) if symbolic and relative else target_path
+        try:
+            exists = os.path.lexists(link_path)
+            if exists and _is_same_link(link_path, target, symbolic):
+                action = 'exists'
+            elif exists and on_collision in ('skip', 'error'):
+                action = 'skip'
+                if on_collision == 'error':
+                    raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), link_path)
+            elif dry_run:
+                action = _plan_link(link_dir, target_path)
+                if exists:
+                    action = f'{on_collision} {action}'
+                    if on_collision == 'rename':
+                        link_path = _rename(link_path)
+                planned_paths.add(link_path)
+            else:
+                if link_dir not in created_dirs:
+                    create_dir(link_dir)
+                    created_dirs.add(link_dir)
+                if not exists:
+                    action = _link(target, link_path, target_path)
+                elif on_collision == 'rename':
+                    link_path = _rename(link_path)
+                    action = f'rename {_link(target, link_path, target_path)}'
+                else:
+                    temp_path = f'{link_path}.{os.getpid()}.tmp'
+                    try:
+                        action = f'replace {_link(target, temp_path, target_path)}'
+                        os.replace(temp_path, link_path)
+                    except BaseException:
+                        if os.path.lexists(temp_path):
+                            os.remove(temp_path)
+                        raise
+        except OSError as e:
+            result['errors'][link_path] = str(e)
+            continue
+        result['actions'].append((action, link_path, target_path))
+        result[action] = result.get(action, 0) + 1
+    result['used_time'] = time.time() - t_start
+    return result
 
 
 if __name__ == '__main__':
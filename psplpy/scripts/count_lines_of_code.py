@@ -10,14 +10,17 @@ def count_non_empty_lines(file_path: str, encoding='utf-8') -> int:
         return len(non_empty_lines)
 
 
-def count(project_dir: str, encoding='utf-8') -> int:
+def count(project_dir: str, encoding='utf-8', exclude_dir_names: list = None) -> int:
     regex_list = [re.compile(r'^(?:(?!\.py$).)*$'), re.compile(r'(?:.)*resource_rc[.]py')]
-    file_path_list = file_util.get_files_in_dir(project_dir, exclude_abspath_match_compiled_regex=regex_list)
-    print(f'文件总数：{len(file_path_list)}')
-    print(file_path_list)
+    file_path_list = []
     sum_count = 0
-    for file_path in file_path_list:
+    # the lines are counted while the directories are still being walked
+    for file_path in file_util.walk_files(project_dir, exclude_abspath_match_compiled_regex=regex_list,
+                                          exclude_dir_names=exclude_dir_names):
+        file_path_list.append(file_path)
         sum_count += count_non_empty_lines(file_path, encoding=encoding)
+    print(f'文件总数：{len(file_path_list)}')
+    print(file_path_list)
     return sum_count
 
 
@@ -0,0 +1,71 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+import tracemalloc
+
+from psplpy import file_util
+
+
+def _hash_by_read(path: str, block_size: int) -> str:
+    hash_obj = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while data := f.read(block_size):
+            hash_obj.update(data)
+    return hash_obj.hexdigest()
+
+
+def _hash_by_readinto(path: str, block_size: int) -> str:
+    hash_obj = hashlib.sha256()
+    with open(path, 'rb') as f:
+        file_util.update_hash_from_file(hash_obj, f, block_size)
+    return hash_obj.hexdigest()
+
+
+def _hash_by_file_digest(path: str, block_size: int) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def _hash_by_mmap(path: str, block_size: int) -> str:
+    hash_obj = hashlib.sha256()
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        hash_obj.update(mapped)
+    return hash_obj.hexdigest()
+
+
+def benchmark(file_size: int = 1024 * 1024 * 256, block_size: int = 1024 * 1024, repeat: int = 3) -> dict:
+    """
+    hash one file by read(), readinto, hashlib.file_digest and mmap.
+    :return: {method_name: {'used_time': best seconds, 'throughput': MB/s, 'allocated': bytes allocated}, ...}
+    """
+    methods = {'read': _hash_by_read, 'readinto': _hash_by_readinto, 'mmap': _hash_by_mmap}
+    if hasattr(hashlib, 'file_digest'):
+        methods['file_digest'] = _hash_by_file_digest
+    result = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'data.bin')
+        with open(path, 'wb') as f:
+            for _ in range(file_size // block_size):
+                f.write(os.urandom(block_size))
+        expected = _hash_by_read(path, block_size)
+        for method_name, method in methods.items():
+            used_time = float('inf')
+            for _ in range(repeat):
+                start_time = time.perf_counter()
+                assert method(path, block_size) == expected
+                used_time = min(used_time, time.perf_counter() - start_time)
+            tracemalloc.start()
+            method(path, block_size)
+            allocated = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            result[method_name] = {'used_time': used_time, 'throughput': file_size / 1024 / 1024 / used_time,
+                                   'allocated': allocated}
+            print(f'{method_name:>12}: {used_time:.4f}s, {result[method_name]["throughput"]:.1f}MB/s, '
+                  f'peak allocated {allocated} bytes')
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
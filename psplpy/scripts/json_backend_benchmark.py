@@ -0,0 +1,45 @@
+import random
+import timeit
+
+from psplpy import data_access
+
+
+def get_payloads() -> dict:
+    random.seed(0)
+    timing_dict = {f'func{i}': [{'elapsed_time': random.random(), 'start_time': 1.7e9 + j} for j in range(500)]
+                   for i in range(20)}
+    ocr_result = {str(page): [{'text': '识别文本 recognized text', 'score': random.random(),
+                               'box': [[random.randint(0, 2000) for _ in range(2)] for _ in range(4)]}
+                              for _ in range(50)] for page in range(100)}
+    config = {'python_path': 'python', 'script_path': '/path/to/script.py', 'dpi': 600, 'debug': False,
+              'skip_page_set': list(range(10)), 'temp_dir': '/tmp/psplpy'}
+    return {'timing_dict': timing_dict, 'ocr_result': ocr_result, 'config': config}
+
+
+def benchmark(number: int = 0, time_significant_digits: int = 5) -> dict:
+    """
+    time the loads and dumps of every available backend on the payloads.
+    :return: {(payload_name, backend_name, 'loads' | 'dumps'): seconds per loop, ...}
+    """
+    result = {}
+    original_backend = data_access.json_backend
+    try:
+        for payload_name, payload in get_payloads().items():
+            data = data_access.json_dumps(payload, ensure_ascii=False)
+            print(f'# {payload_name}: {len(data)} bytes')
+            for backend_name in data_access.json_backends:
+                data_access.set_json_backend(backend_name)
+                for operation, statement in [('loads', lambda: data_access.json_loads(data)),
+                                             ('dumps', lambda: data_access.json_dumps(payload, ensure_ascii=False))]:
+                    timer = timeit.Timer(statement)
+                    loops = number or timer.autorange()[0]
+                    seconds = min(timer.repeat(repeat=5, number=loops)) / loops
+                    result[(payload_name, backend_name, operation)] = seconds
+                    print(f'{backend_name:>8} {operation}: {seconds:.{time_significant_digits}g}s')
+    finally:
+        data_access.set_json_backend(original_backend)
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,15 +1,46 @@
+import argparse
 import ast
+import concurrent.futures
+import gc
+import hashlib
 import inspect
+import json
 import math
 import os
+import platform
+import queue
+import random
 import re
+import statistics
+import subprocess
+import sys
+import time
 import timeit
+import tracemalloc
 from typing import Tuple, Dict, List
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import data_access
 import file_util
 
 setup_func_prefix = 'setup'
 main_func_prefix = 'main_statement'
+# run as `python time_it.py --worker`, it reads a case from stdin as json, and writes the times to stdout as json,
+# what the case itself writes to stdout goes to stderr
+worker_arg = '--worker'
+"""
+the record of every run in the history json lines file:
+{'time': float, 'test_file': str, 'environment': get_environment_info(),
+ 'cases': {case name: {'median': float, 'min': float, 'iqr': float, 'ci_low': float, 'ci_high': float,
+                       'per_loop_median': float, 'times': [float, ...], 'test_num': int}, ...}}
+the case name is like 'setup1.main_statement2', or 'main_statement2' if no setup
+"""
+history_case_stats_keys = ('median', 'min', 'iqr', 'ci_low', 'ci_high', 'per_loop_median', 'times', 'test_num',
+                           'peak_memory', 'retained_memory', 'retained_blocks', 'rss_delta')
 
 
 def get_path_directly_call() -> str:
@@ -91,49 +122,399 @@ def _get_test_functions(function_list: list) -> Tuple[Dict, Dict]:
     return setup_dict, main_dict
 
 
-def _test(setup_dict, main_dict, test_num) -> Dict:
-    test_time_dic = {}
+def _get_cases(setup_dict, main_dict) -> Dict:
+    """:return: {(setup_id, main_id) or main_id if no setup: (main_statement, setup_statement)}"""
     if setup_dict:
-        for i in setup_dict:
-            for j in main_dict:
-                t = timeit.Timer(main_dict[j], setup_dict[i])
-                test_time_dic[(i, j)] = t.timeit(test_num)
-    else:
-        for j in main_dict:
-            t = timeit.Timer(main_dict[j])
-            test_time_dic[j] = t.timeit(test_num)
-    return test_time_dic
+        return {(i, j): (main_dict[j], setup_dict[i]) for i in setup_dict for j in main_dict}
+    return {j: (main_dict[j], 'pass') for j in main_dict}
 
 
-def _start_test(setup_dict, main_dict, test_num, time_significant_digits) -> Tuple[Dict, Dict, Dict]:
-    print('# Start test')
+def _calibrate(timer: timeit.Timer, round_time: float) -> Tuple[int, int]:
+    """
+    like timeit.Timer.autorange, increase the number of loops by 1, 2, 5, 10, 20, 50, ...
+    until a round takes at least min(round_time, 0.2) seconds, then scale it to take about round_time seconds.
+    :return: (number of loops, the rounds run)
+    """
+    min_round_time = min(round_time, 0.2)
+    number = rounds = 0
+    i = 1
+    while True:
+        for j in 1, 2, 5:
+            number = i * j
+            used_time = timer.timeit(number)
+            rounds += 1
+            if used_time >= min_round_time:
+                return max(round(number * round_time / used_time), 1), rounds
+        i *= 10
+
+
+def _get_peak_rss() -> int | None:
+    """the peak resident set size of this process in bytes, or None if it isn't supported"""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # it's in bytes on macos, and in kilobytes on linux
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def _measure_memory(main: str, setup: str, rss: bool = False) -> Dict:
+    """
+    run the main statement once after the setup and a first run (so the caches and imports aren't counted).
+    :return: {'peak_memory': the peak bytes allocated while running, traced by tracemalloc,
+              'retained_memory': the bytes allocated by the run and still alive after it,
+              'retained_blocks': the number of memory blocks allocated by the run and still alive after it,
+              'rss_delta': the growth of the peak rss by the run in bytes if rss, or None}
+    """
+    namespace = {}
+    exec(setup, namespace)
+    code = compile(main, f'<{main_func_prefix}>', 'exec')
+    exec(code, namespace)
+    gc.collect()
+    rss_delta = None
+    if rss and resource is not None:
+        # run without tracemalloc, which takes memory itself, it only grows if the run makes a new peak
+        peak_rss = _get_peak_rss()
+        exec(code, namespace)
+        rss_delta = _get_peak_rss() - peak_rss
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        exec(code, namespace)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        # the snapshots and the locals here are traced too, filter them out
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        differences = tracemalloc.take_snapshot().filter_traces(filters).compare_to(
+            snapshot.filter_traces(filters), 'lineno')
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    return {'peak_memory': peak_memory - start_memory, 'retained_memory': sum(stat.size_diff for stat in differences),
+            'retained_blocks': sum(stat.count_diff for stat in differences), 'rss_delta': rss_delta}
+
+
+def _measure(main: str, setup: str, test_num: int, repeat: int, warmup: int, gc_enabled: bool = False,
+             time_budget: float = 1, memory: bool = False, rss: bool = False) -> Dict:
+    """
+    if test_num <= 0, it's calibrated by _calibrate to make the repeat rounds take about time_budget seconds,
+    and the calibration rounds are counted as the warmup rounds.
+    the warmup rounds are run and discarded, then the repeat rounds are timed.
+    the gc is disabled while timing by timeit, unless gc_enabled.
+    if memory, the memory is measured after timing by _measure_memory, rss is passed to it.
+    :return: {'times': [time of test_num loops, ...] of the repeat rounds, 'test_num': int,
+              and the results of _measure_memory if memory}
+    """
+    # the setup is run in the namespace of timeit, which has imported gc
+    timer = timeit.Timer(main, f'gc.enable()\n{setup}' if gc_enabled else setup)
+    # the garbage of the previous cases shouldn't be collected while timing this one
+    gc.collect()
     if test_num <= 0:
-        test_num = 1
-        while True:
-            longest_time = sorted(_test(setup_dict, main_dict, test_num).values())[-1]
-            if longest_time < 0.001:
-                test_num *= 10
-            else:
-                break
-        test_num = math.ceil(1 / longest_time) * test_num
+        test_num, calibration_rounds = _calibrate(timer, time_budget / repeat)
+        warmup = max(warmup - calibration_rounds, 0)
+    for _ in range(warmup):
+        timer.timeit(test_num)
+    result = {'times': timer.repeat(repeat=repeat, number=test_num), 'test_num': test_num}
+    if memory:
+        result.update(_measure_memory(main, setup, rss))
+    return result
+
+
+def _run_worker() -> None:
+    """the entry of the isolated process, see _measure_in_process"""
+    task = json.load(sys.stdin)
+    sys.path[:0] = task.pop('sys_path')
+    cpu = task.pop('cpu')
+    if cpu is not None:
+        os.sched_setaffinity(0, {cpu})
+    # keep the stdout for the result only, so the prints of the case (also those of c code) can't break the json
+    sys.stdout.flush()
+    result_fd = os.dup(sys.stdout.fileno())
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    result = _measure(**task)
+    sys.stdout.flush()
+    with os.fdopen(result_fd, 'w') as f:
+        json.dump(result, f)
+
+
+def _measure_in_process(main: str, setup: str, test_num: int, repeat: int, warmup: int, gc_enabled: bool = False,
+                        time_budget: float = 1, memory: bool = False, rss: bool = False, cpu: int = None) -> Dict:
+    """run _measure in a new python process, so the cases don't affect each other, pinned to the cpu if given"""
+    task = {'main': main, 'setup': setup, 'test_num': test_num, 'repeat': repeat, 'warmup': warmup,
+            'gc_enabled': gc_enabled, 'time_budget': time_budget, 'memory': memory, 'rss': rss, 'cpu': cpu,
+            'sys_path': sys.path}
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), worker_arg], input=json.dumps(task),
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f'the isolated test failed:\n{main}\n{result.stderr}')
+    return json.loads(result.stdout)
+
+
+def _get_cpus(pin_cpu: bool) -> List:
+    """the cpus can be used by this process, or [None] if not pin_cpu or it isn't supported"""
+    if pin_cpu and hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return [None]
+
+
+def _test(setup_dict, main_dict, test_num, repeat: int = 1, warmup: int = 0, gc_enabled: bool = False,
+          time_budget: float = 1, memory: bool = False, rss: bool = False, isolate: bool = False, processes: int = 1,
+          pin_cpu: bool = False) -> Dict:
+    """
+    if isolate, every case is run in a new process, processes of them are run in parallel,
+    and they are pinned to different cpus if pin_cpu.
+    :return: {case key: {'times': [time of test_num loops, ...], 'test_num': int}}, see _measure
+    """
+    cases = _get_cases(setup_dict, main_dict)
+    if not isolate:
+        return {key: _measure(main, setup, test_num, repeat, warmup, gc_enabled, time_budget, memory, rss)
+                for key, (main, setup) in cases.items()}
+    processes = max(processes, 1)
+    # a case takes a free cpu and gives it back when done, so the cases run at the same time never share a cpu,
+    # and at most len(cpus) of them run at the same time if pin_cpu
+    free_cpus = queue.Queue()
+    cpus = _get_cpus(pin_cpu)
+    for cpu in cpus if cpus != [None] else cpus * processes:
+        free_cpus.put(cpu)
+
+    def measure(main: str, setup: str) -> Dict:
+        cpu = free_cpus.get()
+        try:
+            return _measure_in_process(main, setup, test_num, repeat, warmup, gc_enabled, time_budget, memory, rss,
+                                       cpu)
+        finally:
+            free_cpus.put(cpu)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=processes) as executor:
+        futures = {key: executor.submit(measure, main, setup) for key, (main, setup) in cases.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+
+def _bootstrap_medians(times: List[float], rng: random.Random, resamples: int) -> List[float]:
+    return [statistics.median(rng.choices(times, k=len(times))) for _ in range(resamples)]
+
+
+def get_time_statistics(times: List[float], test_num: int = 1, resamples: int = 1000,
+                        confidence: float = 0.95) -> Dict:
+    """
+    :return: {'median': float, 'min': float, 'mean': float, 'iqr': float, 'ci_low': float, 'ci_high': float,
+              'outliers': [indexes of the times out of the Tukey's fences (1.5 IQR)],
+              'per_loop_median': float, 'per_loop_min': float, 'times': list}
+        ci_low and ci_high are the bootstrap confidence interval of the median
+    """
+    if len(times) > 1:
+        q1, _, q3 = statistics.quantiles(times, n=4, method='inclusive')
     else:
-        test_num = int(test_num)
+        q1 = q3 = times[0]
+    iqr = q3 - q1
+    medians = sorted(_bootstrap_medians(times, random.Random(0), resamples))
+    tail = (1 - confidence) / 2
+    median = statistics.median(times)
+    return {'median': median, 'min': min(times), 'mean': statistics.fmean(times), 'iqr': iqr,
+            'ci_low': medians[int(tail * (resamples - 1))], 'ci_high': medians[math.ceil((1 - tail) * (resamples - 1))],
+            'outliers': [i for i, t in enumerate(times) if t < q1 - 1.5 * iqr or t > q3 + 1.5 * iqr],
+            'per_loop_median': median / test_num, 'per_loop_min': min(times) / test_num, 'times': times}
+
 
-    print(f'# Number of tests: {test_num}')
-    test_time_dic = _test(setup_dict, main_dict, test_num)
-    test_time_dic_value_sorted = sorted(test_time_dic.values())
-    keys_lst = []
-    for test_time_dic_value in test_time_dic_value_sorted:
-        keys_lst.extend(key for key in test_time_dic.keys() if test_time_dic[key] == test_time_dic_value)
+def is_significantly_different(times_a: List[float], times_b: List[float], resamples: int = 1000,
+                               confidence: float = 0.95) -> bool:
+    """whether the bootstrap confidence interval of the difference between the medians doesn't contain 0"""
+    rng = random.Random(0)
+    differences = sorted(a - b for a, b in zip(_bootstrap_medians(times_a, rng, resamples),
+                                               _bootstrap_medians(times_b, rng, resamples)))
+    tail = (1 - confidence) / 2
+    low, high = differences[int(tail * (resamples - 1))], differences[math.ceil((1 - tail) * (resamples - 1))]
+    return low > 0 or high < 0
 
-    test_time_dic = dict((key, test_time_dic[key]) for key in keys_lst)
+
+def _format_bytes(size: int) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return f'{size:.4g}{unit}'
+        size /= 1024
+    return f'{size:.4g}GB'
+
+
+def _print_statistics(time_stats: Dict, time_significant_digits: int) -> None:
+    def _f(t: float) -> str:
+        return f'{t:.{time_significant_digits}g}'
+
+    def _memory(case_stats: Dict) -> str:
+        if 'peak_memory' not in case_stats:
+            return ''
+        memory_ratio = f' ({_f(case_stats["memory_ratio"])})' if case_stats['memory_ratio'] is not None else ''
+        rss = f', rss +{_format_bytes(case_stats["rss_delta"])}' if case_stats['rss_delta'] is not None else ''
+        return (f', peak {_format_bytes(case_stats["peak_memory"])}{memory_ratio}, retained '
+                f'{_format_bytes(case_stats["retained_memory"])} in {case_stats["retained_blocks"]} blocks{rss}')
+
+    print('# case: median [95% CI] IQR min (seconds per loop), number of loops, outliers, ratio to the fastest, '
+          '"~" means the difference from the fastest isn\'t significant, '
+          'and the memory of a run if measured, with the ratio of the peak to the fastest')
+    for key, case_stats in time_stats.items():
+        mark = '' if case_stats['significant'] else ' ~'
+        test_num = case_stats['test_num']
+        print(f'{key}: {_f(case_stats["median"] / test_num)} [{_f(case_stats["ci_low"] / test_num)}, '
+              f'{_f(case_stats["ci_high"] / test_num)}] {_f(case_stats["iqr"] / test_num)} '
+              f'{_f(case_stats["min"] / test_num)}, {test_num} loops, {len(case_stats["outliers"])} outliers, '
+              f'{_f(case_stats["ratio"])}{mark}{_memory(case_stats)}')
+
+
+def _start_test(setup_dict, main_dict, test_num, time_significant_digits, repeat: int = 5, warmup: int = 1,
+                stats: Dict = None, **test_kwargs) -> Tuple[Dict, Dict, Dict]:
+    """
+    if test_num <= 0, it's calibrated for every case, see _measure,
+    and the times in the returned dicts are per loop, because the numbers of loops are different.
+    test_kwargs are passed to _test
+    """
+    print('# Start test')
+    calibrate = test_num <= 0
+    test_num = 0 if calibrate else int(test_num)
+    print(f'# Number of tests: {"calibrated for every case" if calibrate else test_num}, '
+          f'repeat: {repeat}, warmup: {warmup}')
+    results = _test(setup_dict, main_dict, test_num, repeat, warmup, **test_kwargs)
+    time_stats = {key: {**get_time_statistics(result.pop('times'), result['test_num']), **result}
+                  for key, result in results.items()}
+    # sorted by the median per loop, it's robust to the noise
+    time_stats = dict(sorted(time_stats.items(), key=lambda item: item[1]['per_loop_median']))
+    keys_lst = list(time_stats)
+    fastest_stats = time_stats[keys_lst[0]]
+    fastest_times = [t / fastest_stats['test_num'] for t in fastest_stats['times']]
+    for key, case_stats in time_stats.items():
+        case_stats['ratio'] = case_stats['per_loop_median'] / fastest_stats['per_loop_median']
+        case_stats['significant'] = key == keys_lst[0] or is_significantly_different(
+            [t / case_stats['test_num'] for t in case_stats['times']], fastest_times)
+        if 'peak_memory' in case_stats:
+            case_stats['memory_ratio'] = (case_stats['peak_memory'] / fastest_stats['peak_memory']
+                                          if fastest_stats['peak_memory'] > 0 else None)
+    _print_statistics(time_stats, time_significant_digits)
+    if stats is not None:
+        stats.update(time_stats)
+
+    median_key = 'per_loop_median' if calibrate else 'median'
+    test_time_dic = dict((key, time_stats[key][median_key]) for key in keys_lst)
     test_time_dic_ratio = dict(
         (key, f'{test_time_dic[key] / test_time_dic[keys_lst[0]]:.{time_significant_digits}g}') for key in keys_lst)
     test_time_dic_str = dict((key, f'{test_time_dic[key]:.{time_significant_digits}g}') for key in keys_lst)
     return test_time_dic, test_time_dic_str, test_time_dic_ratio
 
 
-def time_it(__file__, test_num: int = 0, time_significant_digits: int = 5) -> Tuple[Dict, Dict, Dict]:
+def get_case_name(key) -> str:
+    if isinstance(key, tuple):
+        return f'{setup_func_prefix}{key[0]}.{main_func_prefix}{key[1]}'
+    return f'{main_func_prefix}{key}'
+
+
+def get_git_commit(directory: str) -> str | None:
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=directory, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def get_environment_info(directory: str = '.') -> Dict:
+    """
+    :return: {'git_commit': str | None, 'python_version': str, 'python_implementation': str, 'hostname': str,
+              'host_fingerprint': str}, the results on the hosts with the same fingerprint are comparable
+    """
+    host = (platform.node(), platform.machine(), platform.processor(), platform.platform(), os.cpu_count())
+    return {'git_commit': get_git_commit(directory), 'python_version': platform.python_version(),
+            'python_implementation': platform.python_implementation(), 'hostname': platform.node(),
+            'host_fingerprint': hashlib.sha1(repr(host).encode()).hexdigest()[:16]}
+
+
+def save_history(history_path: str, test_file: str, stats: Dict) -> Dict:
+    """append the stats of time_it as a record to the history, see the history record format above"""
+    test_file = os.path.abspath(test_file)
+    record = {'time': time.time(), 'test_file': test_file,
+              'environment': get_environment_info(os.path.dirname(test_file)),
+              'cases': {get_case_name(key): {k: case_stats[k] for k in history_case_stats_keys if k in case_stats}
+                        for key, case_stats in stats.items()}}
+    data_access.JsonLinesStore(history_path).append(record)
+    return record
+
+
+def compare_history(history_path: str, test_file: str = None, baseline: str = None, window: int = 5,
+                    threshold: float = 0.1) -> Dict:
+    """
+    compare the per loop medians of the latest run with the baseline run, whose git commit starts with baseline,
+    or with the median of the last window runs before the latest one if no baseline.
+    only the runs of the same test file (the latest one's if not given) on the same host are compared.
+    a case slower than the reference by more than threshold (0.1 means 10%) is a regression,
+    if it's compared with a baseline run, the difference must also be significant (see is_significantly_different).
+    :return: {'latest': record, 'references': [records], 'cases': {case name: {'current': float,
+              'reference': float, 'change': current / reference - 1}},
+              'regressions': [case names], 'improvements': [case names]}
+    :raise ValueError: if there is nothing to compare the latest run with
+    """
+    records = list(data_access.JsonLinesStore(history_path))
+    if test_file:
+        records = [record for record in records if record['test_file'] == os.path.abspath(test_file)]
+    if not records:
+        raise ValueError(f'no history of {test_file or "any test file"} in {history_path}')
+    latest = records[-1]
+    records = [record for record in records[:-1] if record['test_file'] == latest['test_file'] and
+               record['environment']['host_fingerprint'] == latest['environment']['host_fingerprint']]
+    if baseline:
+        references = [record for record in records
+                      if (record['environment']['git_commit'] or '').startswith(baseline)][-1:]
+        if not references:
+            raise ValueError(f'no history of the baseline {baseline} in {history_path}')
+    else:
+        references = records[-window:]
+        if not references:
+            raise ValueError(f'no earlier history of {latest["test_file"]} on this host in {history_path}')
+    result = {'latest': latest, 'references': references, 'cases': {}, 'regressions': [], 'improvements': []}
+    for case_name, case_stats in latest['cases'].items():
+        reference_medians = [record['cases'][case_name]['per_loop_median'] for record in references
+                             if case_name in record['cases']]
+        if not reference_medians:
+            continue
+        reference = statistics.median(reference_medians)
+        change = case_stats['per_loop_median'] / reference - 1
+        result['cases'][case_name] = {'current': case_stats['per_loop_median'], 'reference': reference,
+                                      'change': change}
+        significant = True
+        if baseline:
+            # the times of different test_num are compared per loop
+            reference_stats = references[0]['cases'][case_name]
+            significant = is_significantly_different(
+                [t / case_stats['test_num'] for t in case_stats['times']],
+                [t / reference_stats['test_num'] for t in reference_stats['times']])
+        if significant and change > threshold:
+            result['regressions'].append(case_name)
+        elif significant and change < -threshold:
+            result['improvements'].append(case_name)
+    if not result['cases']:
+        raise ValueError(f'no case of the latest run of {latest["test_file"]} is in the earlier history')
+    return result
+
+
+def time_it(__file__, test_num: int = 0, time_significant_digits: int = 5, repeat: int = 5, warmup: int = 1,
+            stats: Dict = None, gc_enabled: bool = False, isolate: bool = False, processes: int = 1,
+            pin_cpu: bool = False, history_path: str = None, time_budget: float = 1, memory: bool = False,
+            rss: bool = False) -> Tuple[Dict, Dict, Dict]:
+    """
+    every case is run warmup rounds, then timed repeat rounds of test_num loops,
+    the times in the returned dicts are the medians of the rounds.
+    if test_num <= 0, the number of loops is calibrated for every case like timeit.Timer.autorange,
+    to make its repeat rounds take about time_budget seconds, the calibration rounds are counted as warmup,
+    and the times in the returned dicts are the medians per loop.
+    if stats dict is given, it's updated with
+        {case key: get_time_statistics() + {'test_num': int, 'ratio': float, 'significant': bool}
+                   + (_measure_memory() + {'memory_ratio': float | None} if memory)},
+    significant means whether the case is significantly different from the fastest one.
+    the gc is disabled while timing, unless gc_enabled.
+    if isolate, every case is run in a new python process, so the gc state, caches and imports of the earlier cases
+    don't affect the later ones, processes cases are run in parallel, and if pin_cpu,
+    they are pinned to different cpus by os.sched_setaffinity (linux only).
+    if history_path is given, the stats are appended to it, see save_history and compare_history.
+    if memory, the memory of a run of every case is measured after timing, see _measure_memory,
+    and the results are added to stats and printed, with the ratio of the peak memory to the fastest case,
+    if rss, the growth of the peak rss is measured too, it's more meaningful if isolate.
+    """
     file_path = os.path.abspath(__file__)
     with open(file_path, encoding='utf-8') as f:
         content = f.read()
@@ -142,8 +523,45 @@ def time_it(__file__, test_num: int = 0, time_significant_digits: int = 5) -> Tu
     if not main_dict:
         raise ValueError(f"Please use {__name__}.{generate_time_it_template.__name__}() to generate a test template "
                          f"file first, or add some {main_func_prefix} test examples.")
-    return _start_test(setup_dict, main_dict, test_num, time_significant_digits)
+    stats = {} if stats is None else stats
+    result = _start_test(setup_dict, main_dict, test_num, time_significant_digits, repeat, warmup, stats,
+                         gc_enabled=gc_enabled, time_budget=time_budget, memory=memory, rss=rss, isolate=isolate,
+                         processes=processes, pin_cpu=pin_cpu)
+    if history_path:
+        save_history(history_path, file_path, stats)
+    return result
+
+
+def _main(args: List[str] = None) -> int:
+    """
+    python time_it.py compare history.jsonl [--test-file path] [--baseline commit] [--window 5] [--threshold 0.1]
+    :return: the exit code, 1 if there are regressions, 2 if there is no history to compare
+    """
+    parser = argparse.ArgumentParser(prog='time_it.py')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compare_parser = subparsers.add_parser('compare', help='compare the latest run in the history with the earlier')
+    compare_parser.add_argument('history_path')
+    compare_parser.add_argument('--test-file')
+    compare_parser.add_argument('--baseline', help='the git commit (prefix) of the baseline run')
+    compare_parser.add_argument('--window', type=int, default=5)
+    compare_parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args(args)
+    try:
+        result = compare_history(args.history_path, args.test_file, args.baseline, args.window, args.threshold)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    print(f'# {result["latest"]["test_file"]}, compared with {len(result["references"])} runs')
+    for case_name, case_result in result['cases'].items():
+        mark = ' REGRESSION' if case_name in result['regressions'] else \
+            ' improvement' if case_name in result['improvements'] else ''
+        print(f'{case_name}: {case_result["current"]:.5g}s / {case_result["reference"]:.5g}s per loop, '
+              f'{case_result["change"]:+.2%}{mark}')
+    return 1 if result['regressions'] else 0
 
 
 if __name__ == '__main__':
-    pass
\ No newline at end of file
+    if sys.argv[1:] == [worker_arg]:
+        _run_worker()
+    else:
+        sys.exit(_main())
\ No newline at end of file
@@ -4,13 +4,20 @@ import data_access
 
 """
 timing_dict = {func_name->str: [{'elapsed_time': float, 'start_time': float}, ...], ...}
+if the path ends with .jsonl, the timing records are appended to it by data_access.JsonLinesStore,
+instead of loading and dumping the whole json file.
 """
 timing_dict = {}
 timing_dict_save_path = ['']
+jsonl_ext = '.jsonl'
 
 
 def timing_decorator(enable: bool = True, show_time: bool = False, set_path_and_real_time_write: str = None):
     def decorator(func):
+        store = None
+        if set_path_and_real_time_write and set_path_and_real_time_write.endswith(jsonl_ext):
+            store = data_access.JsonLinesStore(set_path_and_real_time_write)
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             if not enable:
@@ -22,13 +29,15 @@ def timing_decorator(enable: bool = True, show_time: bool = False, set_path_and_
             global timing_dict
             if show_time:
                 print(f'{func.__name__}: {elapsed_time}s')
-            if set_path_and_real_time_write:
+            if set_path_and_real_time_write and not store:
                 timing_dict = data_access.load_json_maybe_null(set_path_and_real_time_write, dict)
             if not timing_dict.get(func.__name__):
                 timing_dict[func.__name__] = []
             info_dict = {'elapsed_time': elapsed_time, 'start_time': start_time}
             timing_dict[func.__name__].append(info_dict)
-            if set_path_and_real_time_write:
+            if store:
+                store.append({func.__name__: [info_dict]})
+            elif set_path_and_real_time_write:
                 data_access.dump_json_human_friendly(timing_dict, set_path_and_real_time_write)
             return result
         return wrapper
@@ -38,7 +47,12 @@ def timing_decorator(enable: bool = True, show_time: bool = False, set_path_and_
 def set_path_and_save_timing_dict(path: str = 'timing.json', is_add: bool = True):
     global timing_dict_save_path
     timing_dict_save_path[0] = path
-    if is_add:
+    if path.endswith(jsonl_ext):
+        store = data_access.JsonLinesStore(path)
+        if not is_add:
+            store.clear()
+        store.append(timing_dict)
+    elif is_add:
         old_timing_dict = data_access.load_json_maybe_null(path, dict)
         for key in timing_dict:
             if old_timing_dict.get(key):
@@ -49,3 +63,8 @@ def set_path_and_save_timing_dict(path: str = 'timing.json', is_add: bool = True
     else:
         data_access.dump_json_human_friendly(timing_dict, path)
 
+
+def load_timing_dict(path: str = 'timing.json') -> dict:
+    if path.endswith(jsonl_ext):
+        return data_access.JsonLinesStore(path).load() or {}
+    return data_access.load_json_maybe_null(path, dict)
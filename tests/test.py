@@ -1,4 +1,15 @@
+import hashlib
+import io
+import json
+import os
+import pickle
+import threading
+import zipfile
+
+import data_access
+import file_util
 import image_util
+import time_it
 
 
 def test_image_util():
@@ -16,3 +27,489 @@ def test_image_util():
     assert image_util.trans_to_ltrb(ltwh) == ltrb
     assert image_util.trans_to_ltrb(four_vertexes) == ltrb
 
+
+
+def test_lzma_multiprocessing(tmp_path):
+    data = os.urandom(1000) * 300
+    input_path, compressed_path, output_path = tmp_path / 'input', tmp_path / 'input.xz', tmp_path / 'output'
+    input_path.write_bytes(data)
+
+    # the positional arguments of the older versions: ..., max_queue_length, sleep_time, show_progress_bar
+    data_access.compress_file_multiprocessing_lzma(str(input_path), str(compressed_path), 2, 1024 * 64, 2, 0.1, False)
+    index = data_access.get_lzma_stream_index(str(compressed_path))
+    assert len(index) == 5
+    assert sum(stream['uncompressed_size'] for stream in index) == len(data)
+
+    data_access.decompress_file_multiprocessing_lzma(str(compressed_path), str(output_path), num_processes=2)
+    assert output_path.read_bytes() == data
+    start = 1024 * 64 - 10
+    assert data_access.read_range_lzma(str(compressed_path), start, 100, index) == data[start:start + 100]
+
+
+def test_compress_file_multiprocessing(tmp_path):
+    src_dir = tmp_path / 'src'
+    (src_dir / 'sub').mkdir(parents=True)
+    contents = {'a.txt': b'hello ' * 10000, 'sub/b.png': b'png' * 1000, 'sub/big.txt': b'big ' * 50000,
+                'random.bin': os.urandom(5000), 'empty.txt': b''}
+    for name, data in contents.items():
+        (src_dir / name).write_bytes(data)
+
+    class Unseekable:
+        def __init__(self):
+            self.buffer = io.BytesIO()
+
+        def write(self, data):
+            return self.buffer.write(data)
+
+        def flush(self):
+            pass
+
+    unseekable = Unseekable()
+    for output, kwargs in ((str(tmp_path / 'out.zip'), {}), (unseekable, {'max_pending_size': 1})):
+        data_access.compress_file_multiprocessing(str(src_dir), output, start_path=str(src_dir), num_processes=2,
+                                                  max_member_size=100000, max_queue_length=2, **kwargs)
+        with zipfile.ZipFile(output if isinstance(output, str) else io.BytesIO(unseekable.buffer.getvalue())) as zipf:
+            assert zipf.testzip() is None
+            assert {name: zipf.read(name) for name in contents} == contents
+            types = {info.filename: info.compress_type for info in zipf.infolist()}
+        # the stored extensions and the incompressible data are stored, the big file is compressed in streaming
+        assert types['sub/b.png'] == types['random.bin'] == zipfile.ZIP_STORED
+        assert types['a.txt'] == types['sub/big.txt'] == zipfile.ZIP_DEFLATED
+    data_access.extract_file_multiprocessing(str(tmp_path / 'out.zip'), str(tmp_path / 'dst'), num_processes=2)
+    assert {name: (tmp_path / 'dst' / name).read_bytes() for name in contents} == contents
+
+
+def test_codec_registry():
+    obj = {'page': 1, 'text': ['hello'] * 100}
+    for codec in data_access.codecs:
+        compressed_data = data_access.compress_obj(obj, codec, level=1)
+        assert data_access.decompress_obj(compressed_data) == obj
+    data_access.register_codec('zlib-with-dict', 'zlib', level=9, dictionary=b'hello' * 10)
+    assert data_access.decompress_obj(data_access.compress_obj(obj, 'zlib-with-dict')) == obj
+
+
+def test_compress_and_store_obj(tmp_path):
+    file_path = str(tmp_path / 'obj.bin')
+    obj = {'array': bytearray(range(256)) * 1024 * 16, 'list': list(range(1000))}
+    with data_access.trace_peak_memory() as memory_info:
+        data_access.compress_and_store_obj(obj, file_path, 'zlib')
+    assert memory_info['peak_memory'] < len(obj['array'])
+    assert data_access.load_and_decompress_obj(file_path) == obj
+    # the file and the data of compress_obj are interchangeable
+    with open(file_path, 'rb') as f:
+        assert data_access.decompress_obj(f.read()) == obj
+    with open(file_path, 'wb') as f:
+        f.write(data_access.compress_obj(obj, 'zlib'))
+    assert data_access.load_and_decompress_obj(file_path) == obj
+
+
+def test_convert_json_dict_key_to_number():
+    data = {'1': {'2.5': [{'-3': 'a', 'b': None}]}, 'text': ('x', {'+4': 1})}
+    converted = {1: {2.5: [{-3: 'a', 'b': None}]}, 'text': ('x', {4: 1})}
+    assert data_access.convert_json_dict_key_to_number(data) == converted
+    unchanged = {'a': [{'b': 1}]}
+    assert data_access.convert_json_dict_key_to_number(unchanged) is unchanged
+    assert json.loads(json.dumps(data), object_pairs_hook=data_access.number_key_object_pairs_hook) == {
+        1: {2.5: [{-3: 'a', 'b': None}]}, 'text': ['x', {4: 1}]}
+
+
+def test_find_duplicate_files(tmp_path):
+    data = os.urandom(1024 * 300)
+    (tmp_path / 'a').write_bytes(data)
+    (tmp_path / 'b').write_bytes(data)
+    (tmp_path / 'c').write_bytes(data[:1024 * 100] + b'x' + data[1024 * 100 + 1:])
+    (tmp_path / 'd').write_bytes(b'small')
+    stats = {}
+    duplicates = file_util.find_duplicate_files(str(tmp_path), stats=stats)
+    assert list(duplicates.values()) == [[str(tmp_path / 'a'), str(tmp_path / 'b')]]
+    assert stats['size_candidate_count'] == 3 and stats['sample_candidate_count'] == 3
+    assert stats['duplicate_bytes'] == len(data)
+    os.link(tmp_path / 'c', tmp_path / 'c_link')
+    # a file duplicated only by its hard link isn't read at all
+    (tmp_path / 'e').write_bytes(os.urandom(1024 * 500))
+    os.link(tmp_path / 'e', tmp_path / 'e_link')
+    duplicates = file_util.find_duplicate_files(str(tmp_path), stats=stats)
+    stat = os.stat(tmp_path / 'e')
+    assert duplicates.pop(f'inode:{stat.st_dev}:{stat.st_ino}') == [str(tmp_path / 'e'), str(tmp_path / 'e_link')]
+    # c has the same sample as a and b, so it's hashed fully, and reported with its hard link
+    assert sorted(duplicates.values()) == [[str(tmp_path / 'a'), str(tmp_path / 'b')],
+                                           [str(tmp_path / 'c'), str(tmp_path / 'c_link')]]
+    assert stats['hashed_bytes'] == 1024 * 128 * 3 + len(data) * 3
+    assert stats['duplicate_bytes'] == len(data)
+
+
+def test_dir_snapshot(tmp_path):
+    directory = tmp_path / 'dir'
+    (directory / '.git').mkdir(parents=True)
+    (directory / '.git' / 'HEAD').write_text('ref')
+    (directory / 'a').write_text('a')
+    (directory / 'b').write_text('b')
+    index_path = str(tmp_path / 'index')
+    snapshot = file_util.DirSnapshot(str(directory), index_path, exclude_dir_names=['.git'])
+    assert snapshot.scan()['added'] == {str(directory / 'a'), str(directory / 'b')}
+    (directory / 'a').write_text('aa')
+    (directory / 'b').unlink()
+    (directory / 'c').write_text('c')
+    snapshot = file_util.DirSnapshot(str(directory), index_path, exclude_dir_names=['.git'])
+    assert snapshot.scan() == {'added': {str(directory / 'c')}, 'modified': {str(directory / 'a')},
+                               'removed': {str(directory / 'b')}}
+
+
+def test_hash_cache(tmp_path):
+    file_path, db_path = str(tmp_path / 'a.txt'), str(tmp_path / 'cache' / 'hash.db')
+    (tmp_path / 'a.txt').write_text('a')
+    with file_util.PyHash(file_util.PyHash.sha256, cache=db_path) as py_hash:
+        digest = py_hash.cal_file_hash(file_path)
+    with file_util.HashCache(db_path) as cache:
+        assert cache.get(file_path, 'sha256') == digest
+        # a hit returns the stored digest without reading the file
+        cache.set(file_path, 'sha256', 'cached', os.stat(file_path))
+        assert file_util.PyHash('sha256', cache=cache).cal_file_hash(file_path) == 'cached'
+        stat = os.stat(file_path)
+        os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        assert cache.get(file_path, 'sha256') is None
+        cache.set(file_path, 'sha256', 'cached', os.stat(file_path))
+        (tmp_path / 'a.txt').write_text('ab')
+        assert cache.get(file_path, 'sha256') is None
+        cache.set(file_path, 'sha256', 'cached', os.stat(file_path))
+        # the same size and mtime but another inode
+        stat = os.stat(file_path)
+        (tmp_path / 'b.txt').write_text('ab')
+        (tmp_path / 'c.txt').write_text('c')
+        os.utime(tmp_path / 'b.txt', ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(tmp_path / 'b.txt', file_path)
+        assert cache.get(file_path, 'sha256') is None
+    stats = {}
+    paths = [file_path, str(tmp_path / 'c.txt')]
+    assert dict(file_util.hash_files(paths, stats=stats, cache=db_path))[file_path] == \
+        file_util.PyHash('sha256').cal_file_hash(file_path)
+    assert stats['cached_count'] == 0 and stats['file_count'] == 2
+    list(file_util.hash_files(paths, stats=stats, cache=db_path))
+    assert stats['cached_count'] == 2 and stats['file_count'] == 2
+
+
+def test_hash_files(tmp_path):
+    contents = {str(tmp_path / f'{i}.bin'): os.urandom(1000 * i) for i in range(10)}
+    for file_path, data in contents.items():
+        with open(file_path, 'wb') as f:
+            f.write(data)
+    expected = {file_path: hashlib.sha256(data).hexdigest() for file_path, data in contents.items()}
+    for use_process in (False, True):
+        stats = {}
+        result = dict(file_util.hash_files(contents, workers=2, use_process=use_process, block_size=4096,
+                                           stats=stats))
+        assert result == expected
+        assert stats['file_count'] == 10 and stats['cached_count'] == 0
+        assert stats['total_bytes'] == sum(map(len, contents.values()))
+        assert stats['used_time'] > 0 and stats['throughput'] > 0
+    # the reused instance doesn't chain the state of the last calculation
+    py_hash = file_util.PyHash(file_util.PyHash.sha256)
+    for file_path in list(contents)[:3] * 2:
+        assert py_hash.cal_file_hash(file_path) == expected[file_path]
+    assert py_hash.cal_data_hash('a') == py_hash.cal_data_hash('a') == hashlib.sha256(b'a').hexdigest()
+
+
+def test_update_hash_from_file(tmp_path):
+    data = os.urandom(10000)
+    (tmp_path / 'data.bin').write_bytes(data)
+    (tmp_path / 'empty.bin').write_bytes(b'')
+    for file_name, content in (('data.bin', data), ('empty.bin', b'')):
+        # readinto blocks, and mmap if block_size is 0
+        for block_size in (4096, 0):
+            hash_obj = hashlib.sha256()
+            with open(tmp_path / file_name, 'rb') as f:
+                assert file_util.update_hash_from_file(hash_obj, f, block_size) == len(content)
+            assert hash_obj.hexdigest() == hashlib.sha256(content).hexdigest()
+    # the progress is reported at most once per progress_interval, and once at the end
+    for progress_interval, expected_count in ((3600, 1), (0, 4)):
+        progress = []
+        with open(tmp_path / 'data.bin', 'rb') as f:
+            file_util.update_hash_from_file(hashlib.sha256(), f, 4096, lambda *args: progress.append(args),
+                                            progress_interval)
+        assert len(progress) == expected_count and progress[-1] == (10000, 10000)
+    progress = []
+    with open(tmp_path / 'data.bin', 'rb') as f:
+        file_util.update_hash_from_file(hashlib.sha256(), f, 0, lambda *args: progress.append(args))
+    assert progress == [(10000, 10000)]
+
+
+def test_rename_duplicate_file(tmp_path):
+    file_path = str(tmp_path / 'page.png')
+    assert file_util.rename_duplicate_file(file_path, reserve=True) == file_path
+    names = [file_util.rename_duplicate_file(file_path, reserve=True) for _ in range(3)]
+    assert names == [str(tmp_path / f'page({i}).png') for i in range(1, 4)]
+    # without reserve, the name isn't taken, so it's the same until it's created
+    (tmp_path / 'a.png').touch()
+    names = [file_util.rename_duplicate_file(str(tmp_path / 'a.png')) for _ in range(3)]
+    assert names == [str(tmp_path / 'a(1).png')] * 3
+    (tmp_path / 'new(7).png').touch()
+    assert file_util.rename_duplicate_file(str(tmp_path / 'new(7).png'), scan=True) == str(tmp_path / 'new(8).png')
+
+
+def test_walk_files(tmp_path):
+    for i in range(30):
+        (tmp_path / f'd{i % 3}' / f'e{i % 5}').mkdir(parents=True, exist_ok=True)
+        (tmp_path / f'd{i % 3}' / f'e{i % 5}' / f'{i}.txt').touch()
+        (tmp_path / f'd{i % 3}' / f'{i}.py').touch()
+    expected = list(file_util.walk_files(str(tmp_path), exclude_dir_names=['e4'], workers=1))
+    assert len(expected) == 54
+    # the scans in the thread pool are limited to 8 for 2 workers, the order is still the same as os.walk
+    assert list(file_util.walk_files(str(tmp_path), exclude_dir_names=['e4'], workers=2)) == expected
+    assert list(file_util.walk_files(str(tmp_path), exclude_dir_names=['e4'])) == expected
+
+
+def test_copy_tree_parallel(tmp_path):
+    (tmp_path / 'src' / 'sub').mkdir(parents=True)
+    for i in range(20):
+        (tmp_path / 'src' / 'sub' / f'{i}.txt').write_text(str(i) * i)
+    result = file_util.copy_tree_parallel(str(tmp_path / 'src'), str(tmp_path / 'dst'), workers=4)
+    assert result['file_count'] == 20 and sum(result['methods'].values()) == 20
+    for i in range(20):
+        assert (tmp_path / 'dst' / 'sub' / f'{i}.txt').read_text() == str(i) * i
+    result = file_util.copy_many([(str(tmp_path / 'src' / 'sub' / '1.txt'), str(tmp_path / 'dst' / '1.txt'))] * 2,
+                                 hard_link=True)
+    # the two copies reserve their names concurrently, so either may get the original name
+    assert sorted(result['dst_paths']) == [str(tmp_path / 'dst' / '1(1).txt'), str(tmp_path / 'dst' / '1.txt')]
+
+
+def test_build_link_farm(tmp_path):
+    (tmp_path / 'a').write_text('a')
+    (tmp_path / 'b').write_text('b')
+    link_target_dict = {str(tmp_path / 'farm' / 'a'): str(tmp_path / 'a'), str(tmp_path / 'farm' / 'b'): str(tmp_path / 'b')}
+    result = file_util.build_link_farm(link_target_dict, dry_run=True)
+    assert result['link'] == 2 and not (tmp_path / 'farm').exists()
+    assert file_util.build_link_farm(link_target_dict)['link'] == 2
+    assert os.path.samefile(tmp_path / 'farm' / 'a', tmp_path / 'a')
+    assert file_util.build_link_farm(link_target_dict)['exists'] == 2
+    result = file_util.build_link_farm({str(tmp_path / 'farm' / 'a'): str(tmp_path / 'b')}, on_collision='replace')
+    assert result['replace link'] == 1 and (tmp_path / 'farm' / 'a').read_text() == 'b'
+    # dry run plans the renamed names without taking them
+    for _ in range(2):
+        result = file_util.build_link_farm({str(tmp_path / 'farm' / 'a'): str(tmp_path / 'a')},
+                                           on_collision='rename', dry_run=True)
+        assert result['actions'] == [('rename link', str(tmp_path / 'farm' / 'a(1)'), str(tmp_path / 'a'))]
+    assert file_util.rename_duplicate_file(str(tmp_path / 'farm' / 'a')) == str(tmp_path / 'farm' / 'a(1)')
+    # the temp link is removed if it can't replace the link path
+    (tmp_path / 'farm' / 'dir').mkdir()
+    result = file_util.build_link_farm({str(tmp_path / 'farm' / 'dir'): str(tmp_path / 'a')}, on_collision='replace')
+    assert str(tmp_path / 'farm' / 'dir') in result['errors']
+    assert sorted(os.listdir(tmp_path / 'farm')) == ['a', 'b', 'dir']
+    # the dangling symbolic links take their names, the dry run and the real run rename the same
+    (tmp_path / 'links').mkdir()
+    os.symlink(str(tmp_path / 'missing'), tmp_path / 'links' / 'a')
+    os.symlink(str(tmp_path / 'missing'), tmp_path / 'links' / 'a(1)')
+    link_target_dict = {str(tmp_path / 'links' / 'a'): str(tmp_path / 'a')}
+    planned = file_util.build_link_farm(link_target_dict, symbolic=True, on_collision='rename', dry_run=True)
+    result = file_util.build_link_farm(link_target_dict, symbolic=True, on_collision='rename')
+    assert planned['actions'] == result['actions'] == [
+        ('rename symlink', str(tmp_path / 'links' / 'a(2)'), str(tmp_path / 'a'))]
+
+
+def test_process_win_reserved_name(tmp_path):
+    assert file_util.process_win_reserved_name(os.path.join('con', 'a', 'NUL.tar.gz'), False) == (
+        True, os.path.join('con_win', 'a', 'NUL_win.tar.gz'))
+    assert file_util.process_win_reserved_name(os.path.join('con_win', 'a'), True) == (True, os.path.join('con', 'a'))
+    (tmp_path / 'aux' / 'sub').mkdir(parents=True)
+    (tmp_path / 'aux' / 'sub' / 'prn.txt').write_text('prn')
+    renamed_dict = file_util.process_win_reserved_names_in_dir(str(tmp_path))
+    assert set(renamed_dict.values()) == {str(tmp_path / 'aux_win'), str(tmp_path / 'aux' / 'sub' / 'prn_win.txt')}
+    assert (tmp_path / 'aux_win' / 'sub' / 'prn_win.txt').read_text() == 'prn'
+
+
+def test_time_statistics():
+    times = [1.0, 1.1, 0.9, 1.0, 5.0]
+    time_stats = time_it.get_time_statistics(times, test_num=10)
+    assert time_stats['median'] == 1.0 and time_stats['min'] == 0.9 and time_stats['outliers'] == [4]
+    assert time_stats['ci_low'] <= 1.0 <= time_stats['ci_high'] and time_stats['per_loop_median'] == 0.1
+    assert time_it.is_significantly_different([1.0, 1.01, 0.99] * 5, [2.0, 2.02, 1.98] * 5)
+    assert not time_it.is_significantly_different([1.0, 1.1, 0.9] * 5, [1.05, 0.95, 1.0] * 5)
+
+
+def test_time_it_isolate(tmp_path):
+    test_file = tmp_path / 'time_test.py'
+    test_file.write_text('def setup1():\n    data = list(range(100))\n\n\n'
+                         'def main_statement1():\n    sum(data)\n\n\n'
+                         'def main_statement2():\n    sorted(data)\n    print(data)\n')
+    stats = {}
+    test_time_dic, test_time_dic_str, test_time_dic_ratio = time_it.time_it(
+        str(test_file), test_num=100, repeat=3, stats=stats, isolate=True, processes=2, pin_cpu=True)
+    assert set(test_time_dic) == set(test_time_dic_ratio) == {(1, 1), (1, 2)}
+    assert all(len(case_stats['times']) == 3 for case_stats in stats.values())
+
+
+def test_time_it_history(tmp_path):
+    history_path = str(tmp_path / 'history.jsonl')
+    test_file = str(tmp_path / 'time_test.py')
+    for per_loop_time in [1.0, 1.1, 0.9, 1.5]:
+        times = [per_loop_time * 10] * 3
+        stats = {(1, 1): {**time_it.get_time_statistics(times, 10), 'test_num': 10},
+                 (1, 2): {**time_it.get_time_statistics([10.0] * 3, 10), 'test_num': 10}}
+        time_it.save_history(history_path, test_file, stats)
+    result = time_it.compare_history(history_path, window=3, threshold=0.2)
+    assert result['cases']['setup1.main_statement1']['reference'] == 1.0
+    assert result['regressions'] == ['setup1.main_statement1'] and len(result['references']) == 3
+    assert time_it._main(['compare', history_path, '--threshold', '0.6']) == 0
+    assert time_it._main(['compare', history_path, '--window', '1']) == 1
+    # a single run, or runs without common cases, has nothing to compare with
+    single_history_path = str(tmp_path / 'single_history.jsonl')
+    time_it.save_history(single_history_path, test_file, stats)
+    assert time_it._main(['compare', single_history_path]) == 2
+    time_it.save_history(single_history_path, test_file, {(1, 3): stats[(1, 1)]})
+    assert time_it._main(['compare', single_history_path]) == 2
+
+
+def test_time_it_calibration(tmp_path):
+    test_file = tmp_path / 'time_test.py'
+    test_file.write_text('def main_statement1():\n    sum(range(10))\n\n\n'
+                         'def main_statement2():\n    sum(range(1000))\n')
+    stats = {}
+    test_time_dic, _, _ = time_it.time_it(str(test_file), repeat=3, stats=stats, time_budget=0.3)
+    assert list(test_time_dic) == [1, 2]
+    assert stats[1]['test_num'] > stats[2]['test_num']
+    assert test_time_dic[1] == stats[1]['per_loop_median']
+
+
+def test_time_it_memory(tmp_path):
+    test_file = tmp_path / 'time_test.py'
+    test_file.write_text('def setup1():\n    data = list(range(10000))\n\n\n'
+                         'def main_statement1():\n    sum(data)\n\n\n'
+                         'def main_statement2():\n    [x * 2 for x in data]\n')
+    stats = {}
+    time_it.time_it(str(test_file), test_num=10, repeat=3, stats=stats, memory=True, gc_enabled=True)
+    assert stats[(1, 2)]['peak_memory'] > 10000 * 8 > stats[(1, 1)]['peak_memory']
+    assert stats[(1, 2)]['retained_blocks'] == 0 and stats[(1, 2)]['rss_delta'] is None
+
+
+def test_copy_tree_parallel_over_hard_links(tmp_path):
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'src' / 'a.txt').write_text('data')
+    file_util.copy_tree_parallel(str(tmp_path / 'src'), str(tmp_path / 'dst'), hard_link=True)
+    assert os.path.samefile(tmp_path / 'src' / 'a.txt', tmp_path / 'dst' / 'a.txt')
+    file_util.copy_tree_parallel(str(tmp_path / 'src'), str(tmp_path / 'dst'))
+    assert (tmp_path / 'src' / 'a.txt').read_text() == (tmp_path / 'dst' / 'a.txt').read_text() == 'data'
+    assert not os.path.samefile(tmp_path / 'src' / 'a.txt', tmp_path / 'dst' / 'a.txt')
+    assert os.listdir(tmp_path / 'dst') == ['a.txt']
+
+
+def test_copy_file_of_zero_reported_size(tmp_path):
+    # the files of /proc report size 0 but have the content
+    if not os.path.exists('/proc/version'):
+        return
+    with open('/proc/version', 'rb') as f:
+        data = f.read()
+    dst_path = file_util.copy_file('/proc/version', str(tmp_path / 'version'))
+    assert data and open(dst_path, 'rb').read() == data
+    result = file_util.copy_many([('/proc/version', str(tmp_path / 'version2'))])
+    assert open(result['dst_paths'][0], 'rb').read() == data
+    (tmp_path / 'empty').touch()
+    assert open(file_util.copy_file(str(tmp_path / 'empty'), str(tmp_path / 'empty2')), 'rb').read() == b''
+
+
+def test_lzma_resumable(tmp_path):
+    data = os.urandom(1000) * 300
+    input_path, compressed_path = str(tmp_path / 'input'), str(tmp_path / 'input.xz')
+    with open(input_path, 'wb') as f:
+        f.write(data)
+    kwargs = {'num_processes': 2, 'chunk_size': 1024 * 64, 'resumable': True}
+    data_access.compress_file_multiprocessing_lzma(input_path, compressed_path, **kwargs)
+    # simulate a crash while writing the last chunk, after its manifest record
+    manifest_path = data_access.get_lzma_manifest_path(compressed_path)
+    with open(manifest_path, 'rb') as f:
+        lines = f.readlines()
+    with open(manifest_path, 'wb') as f:
+        f.writelines(lines[:-1])
+    with open(compressed_path, 'r+b') as f:
+        f.truncate(os.path.getsize(compressed_path) - 10)
+
+    result = data_access.compress_file_multiprocessing_lzma(input_path, compressed_path, **kwargs)
+    assert result['resumed_offset'] == 1024 * 64 * 4
+    with open(manifest_path, 'rb') as f:
+        assert len(f.readlines()) == len(lines)
+    assert data_access.compress_file_multiprocessing_lzma(input_path, compressed_path, **kwargs)[
+               'resumed_offset'] == len(data)
+    assert data_access.verify_file_multiprocessing_lzma(compressed_path, num_processes=2) == {
+        'ok': True, 'checked_chunks': 5, 'bad_chunks': []}
+    with open(compressed_path, 'rb') as f:
+        assert data_access.lzma.decompress(f.read()) == data
+    # the manifest is removed when the output is rewritten without resumable
+    with open(manifest_path, 'rb') as f:
+        old_manifest = f.read()
+    data_access.compress_file_multiprocessing_lzma(input_path, compressed_path, num_processes=2, chunk_size=1024 * 32)
+    assert not os.path.exists(manifest_path)
+    assert data_access.verify_file_multiprocessing_lzma(compressed_path, num_processes=2) == {
+        'ok': True, 'checked_chunks': 10, 'bad_chunks': []}
+    # a manifest not matching the file is ignored
+    with open(manifest_path, 'wb') as f:
+        f.write(old_manifest)
+    assert data_access.verify_file_multiprocessing_lzma(compressed_path, num_processes=2) == {
+        'ok': True, 'checked_chunks': 10, 'bad_chunks': []}
+
+
+def test_pickle_mmap(tmp_path):
+    file_path = str(tmp_path / 'obj.pkl')
+    obj = {'buffer': pickle.PickleBuffer(bytearray(b'abc' * 100)), 'bytes': b'x' * 100, 'small': b'y', 'n': 1}
+    data_access.save_obj_with_pickle_mmap(obj, file_path, alignment=64, min_bytes_size=50)
+    loaded = data_access.load_obj_with_pickle_mmap(file_path)
+    assert isinstance(loaded['buffer'], memoryview) and loaded['buffer'] == b'abc' * 100
+    assert isinstance(loaded['bytes'], memoryview) and loaded['bytes'] == b'x' * 100
+    assert loaded['small'] == b'y' and loaded['n'] == 1
+    assert loaded['buffer'].readonly
+    # writable views are copy-on-write
+    loaded = data_access.load_obj_with_pickle_mmap(file_path, writable=True)
+    loaded['buffer'][0] = ord('z')
+    assert data_access.load_obj_with_pickle_mmap(file_path)['buffer'] == b'abc' * 100
+    # the buffer file of only empty buffers is empty
+    data_access.save_obj_with_pickle_mmap([pickle.PickleBuffer(b''), b''], file_path, min_bytes_size=0)
+    assert os.path.getsize(f'{file_path}.buffers') == 0
+    for writable in (False, True):
+        assert data_access.load_obj_with_pickle_mmap(file_path, writable) == [b'', b'']
+
+
+def test_json_backends(tmp_path):
+    assert data_access.json_backend == next(iter(data_access.json_backends))
+    data = {'a': [1, 2.5, None, '中'], 'b': {'c': True}}
+    try:
+        for name in data_access.json_backends:
+            assert data_access.set_json_backend(name) == data_access.json_backend == name
+            assert data_access.json_loads(data_access.json_dumps(data, ensure_ascii=False)) == data
+            # the options or values the backend doesn't support fall back to the next backends
+            assert data_access.json_dumps(data, indent=4) == json.dumps(data, indent=4).encode()
+            nan_data = {'x': float('nan'), 'y': [float('inf')]}
+            assert data_access.json_dumps(nan_data, ensure_ascii=False) == json.dumps(nan_data).encode()
+            nan = data_access.json_loads(b'{"x": NaN}')['x']
+            assert nan != nan
+        data_access.dump_json_human_friendly({'a': float('-inf')}, str(tmp_path / 'a.json'), indent=2)
+        assert data_access.load_json(str(tmp_path / 'a.json')) == {'a': float('-inf')}
+        try:
+            data_access.set_json_backend('no_such_backend')
+            assert False
+        except ValueError:
+            pass
+    finally:
+        data_access.set_json_backend(next(iter(data_access.json_backends)))
+
+
+def test_json_lines_store(tmp_path):
+    file_path = str(tmp_path / 'store.jsonl')
+    store = data_access.JsonLinesStore(file_path)
+    store.append({'a': ['x']})
+    # a crash may tear a line in the middle of a multibyte character
+    with open(file_path, 'ab') as f:
+        f.write('{"a": ["中'.encode()[:-1])
+    assert store.load() == {'a': ['x']}
+    store.append({'a': ['y'], 'b': 1})
+    assert store.load() == {'a': ['x', 'y'], 'b': 1}
+
+    store.clear()
+
+    def _append(i: int) -> None:
+        thread_store = data_access.JsonLinesStore(file_path, compact_every=20)
+        for j in range(100):
+            thread_store.append({'n': [i * 100 + j]})
+
+    threads = [threading.Thread(target=_append, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(store.load()['n']) == list(range(400))